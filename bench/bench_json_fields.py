@@ -0,0 +1,64 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "task 1"))
+
+from json_fields import LazyJson, extract_fields
+
+PNL_KEYS = ("pnl", "balChg", "realized_pnl", "transaction_cost", "income", "change", "funding") # как в calculate_om_funding_totals
+
+# микробенчмарк json_fields: json.loads против extract_fields и LazyJson.get_many на payload'ах разной формы.
+# вложенные payload'ы с тем же ключом внутри (data[].pnl) - случай, на котором прежний подсчёт глубины был квадратичным
+
+def nested_repeated(n):
+    return json.dumps({"data": [{"pnl": i, "symbol": "OMUSDT"} for i in range(n)], "pnl": 1})
+
+def flat(fields):
+    payload = {f"field_{i}": f"value_{i}" if i % 2 else i * 1.5 for i in range(fields)}
+    payload["pnl"] = "1.5"
+    return json.dumps(payload)
+
+# (название, payload'ы). каждый набор - примерно одинаковый объём работы для json.loads
+def cases(rows):
+    small_nested = [json.dumps({"symbol": "OMUSDT", "ts": 1700000000 + i, "meta": {"pnl": 0}}) for i in range(rows)]
+    small_flat = [json.dumps({"symbol": "OMUSDT", "ts": 1700000000 + i, "pnl": str(-0.01 * i)}) for i in range(rows)]
+    return [
+        ("small nested", small_nested),
+        ("small flat", small_flat),
+        ("flat 100 fields", [flat(100)] * (rows // 20)),
+        ("nested repeated n=100", [nested_repeated(100)] * (rows // 100)),
+        ("nested repeated n=1000", [nested_repeated(1000)] * (rows // 1000)),
+        ("nested repeated n=5000", [nested_repeated(5000)] * max(rows // 5000, 1)),
+    ]
+
+# то, что делал бы вызывающий код без json_fields: полный разбор и выбор ключей
+def loads_keys(raw):
+    data = json.loads(raw)
+    return {k: data[k] for k in PNL_KEYS if k in data}
+
+def timed(fn, payloads):
+    start = time.perf_counter()
+    for raw in payloads:
+        fn(raw)
+    return time.perf_counter() - start
+
+def run(rows):
+    results = []
+    for name, payloads in cases(rows):
+        loads_s = timed(loads_keys, payloads)
+        extract_s = timed(lambda raw: extract_fields(raw, PNL_KEYS), payloads)
+        lazy_s = timed(lambda raw: LazyJson(raw).get_many(PNL_KEYS), payloads)
+        results.append((name, len(payloads), loads_s, extract_s, lazy_s))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare json.loads + key lookup with json_fields.extract_fields / LazyJson.get_many")
+    parser.add_argument("--rows", type=int, default=160_000, help="payloads in the small-payload cases (larger payloads are scaled down)")
+    args = parser.parse_args()
+    print(f"{'case':<24}{'payloads':>10}{'loads s':>10}{'extract s':>11}{'get_many s':>12}")
+    for name, count, loads_s, extract_s, lazy_s in run(args.rows):
+        print(f"{name:<24}{count:>10}{loads_s:>10.3f}{extract_s:>11.3f}{lazy_s:>12.3f}")
@@ -0,0 +1,117 @@
+import argparse
+import csv
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+TRANSFERS_CSV = "BSGDATA_public_data_transfers.csv"
+INSTRUMENTS_CSV = "BSGDATA_public_statichange_instruments_v2.csv"
+ACCOUNTS_CSV = "accounts to exchanges.csv"
+FILLS_CSV = "task 2.csv"
+
+EXCHANGES = ["Binance", "Bybit", "Okex", "Cryptocom", "Paradex", "ME.HitBTC", "Deribit", "Kraken"]
+ASSETS = ["OM", "BTC", "ETH", "SOL", "XRP", "DOGE", "ADA", "AVAX", "LINK", "TON"]
+PNL_KEYS = ("pnl", "balChg", "realized_pnl", "transaction_cost", "income", "change", "funding") # как в calculate_om_funding_totals
+INSTRUMENT_KEYS = ("symbol", "instrument_name", "instId") # как в filter_om_funding
+OTHER_TYPES = [("TRADE", "101"), ("DEPOSIT", "201"), ("WITHDRAW", "202"), ("TRANSFER", "301"), ("FEE", "110")]
+FX_PAIRS = [("USD", "BRL", 5.1), ("USD", "TRY", 19.0), ("EUR", "USD", 1.08), ("USD", "GBP", 0.8), ("EUR", "GBP", 0.87),
+            ("USD", "JPY", 148.0), ("AUD", "USD", 0.66), ("USD", "CHF", 0.88), ("USD", "MXN", 17.2), ("GBP", "JPY", 186.0)]
+START = datetime(2023, 1, 1)
+
+# детерминированные синтетические входы для обеих задач (одинаковый seed - одинаковые файлы):
+# task 1 - transfers (FUNDING/405 вперемешку с другими типами, JSON в info/response, ключ ПнЛ меняется от строки к строке),
+# instruments_v2 и accounts to exchanges; task 2 - сделки по нескольким инструментам с перемешанными по времени инструментами
+
+# имена инструмента актива в том виде, как их пишут разные биржи
+def symbol_forms(asset):
+    return [f"{asset}USDT", f"{asset}-USDT-SWAP", f"{asset.lower()}usdt", f"{asset}_USDT", f"{asset}-PERPETUAL"]
+
+def write_accounts(path, accounts):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "exchange"])
+        for i in range(1, accounts + 1):
+            w.writerow([i, EXCHANGES[i % len(EXCHANGES)]])
+
+def write_instruments(path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["instrument_exch", "instrument_bender", "asset_base", "contract_type", "exchange"])
+        for asset in ASSETS:
+            forms = symbol_forms(asset)
+            for i, exchange in enumerate(EXCHANGES):
+                w.writerow([forms[i % len(forms)], f"{asset}-USDT-SWAP", asset, "perpetual", exchange])
+            w.writerow([f"{asset}_USD", f"{asset}-USD", asset, "spot", EXCHANGES[0]])
+
+# funding_share - доля FUNDING/405 строк, остальное - другие типы переводов
+def write_transfers(path, rows, accounts, rng, funding_share=0.4):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "account_id", "type_exch", "type_id", "side", "amount", "info", "response", "ts"])
+        ts = START
+        for i in range(rows):
+            ts += timedelta(seconds=rng.randint(1, 90))
+            asset = rng.choice(ASSETS)
+            symbol = rng.choice(symbol_forms(asset))
+            side = rng.choice((1, -1))
+            amount = round(rng.expovariate(1.0) * 10, 6)
+            if rng.random() < funding_share:
+                type_exch, type_id = rng.choice((("FUNDING", "405"), ("FUNDING", "0"), ("funding", "405"), ("SETTLEMENT", "405")))
+            else:
+                type_exch, type_id = rng.choice(OTHER_TYPES)
+            if rng.random() < 0.5:
+                # каждый третий JSON в info - многострочный: настоящие переносы внутри кавычек CSV (для csv_chunks)
+                info = json.dumps({rng.choice(INSTRUMENT_KEYS): symbol, "note": "auto\nsettle", "seq": i}, indent=1 if i % 3 == 0 else None)
+            else:
+                info = symbol
+            response = {rng.choice(INSTRUMENT_KEYS): symbol, "ts": int(ts.timestamp() * 1000), "meta": {"pnl": 0}}
+            if rng.random() < 0.85: # у части строк суммы в response нет - берётся amount/side
+                response[rng.choice(PNL_KEYS)] = str(round(side * amount, 6))
+            w.writerow([i + 1, rng.randint(1, accounts), type_exch, type_id, side, amount, info, json.dumps(response), ts.isoformat()])
+
+# disorder - доля сделок, переставленных с соседней (файл перестаёт быть отсортированным по времени)
+def write_fills(path, rows, instruments, rng, disorder=0.0):
+    pairs = FX_PAIRS[:instruments] if instruments <= len(FX_PAIRS) else FX_PAIRS + [
+        (f"X{i:02d}", "USD", 1.0 + i / 10) for i in range(instruments - len(FX_PAIRS))]
+    prices = {f"{b}/{q}": p for b, q, p in pairs}
+    weights = [1.0 / (i + 1) for i in range(len(pairs))] # несколько ликвидных инструментов и длинный хвост
+    out = []
+    minute = 0
+    for _ in range(rows):
+        minute += rng.random() < 0.3
+        base, quote, _ = rng.choices(pairs, weights)[0]
+        name = f"{base}/{quote}"
+        prices[name] *= 1 + rng.gauss(0, 0.001)
+        ts = START + timedelta(minutes=minute)
+        out.append([name, base, quote, rng.choice((1, -1)), round(rng.uniform(1, 500), 1), round(prices[name], 5),
+                    f"{ts.month}/{ts.day}/{ts.year % 100} {ts.hour}:{ts.minute:02d}"])
+    for i in range(len(out) - 1):
+        if rng.random() < disorder:
+            out[i], out[i + 1] = out[i + 1], out[i]
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow(["instrument_exch", "cur_base", "cur_quote", "side", "amount", "price", "ts"])
+        w.writerows(out)
+
+def generate(out_dir, transfers=100_000, fills=100_000, accounts=200, instruments=10, disorder=0.0, seed=1):
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    write_accounts(os.path.join(out_dir, ACCOUNTS_CSV), accounts)
+    write_instruments(os.path.join(out_dir, INSTRUMENTS_CSV))
+    write_transfers(os.path.join(out_dir, TRANSFERS_CSV), transfers, accounts, rng)
+    write_fills(os.path.join(out_dir, FILLS_CSV), fills, instruments, rng, disorder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate deterministic synthetic inputs for task 1 and task 2")
+    parser.add_argument("--out", default="bench_data", help="output directory")
+    parser.add_argument("--transfers", type=int, default=100_000, help="rows in the transfers CSV")
+    parser.add_argument("--fills", type=int, default=100_000, help="rows in the task 2 fills CSV")
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--instruments", type=int, default=10, help="number of FX instruments in the fills CSV")
+    parser.add_argument("--disorder", type=float, default=0.0, help="share of fills swapped with a neighbour (unsorted input)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate(args.out, args.transfers, args.fills, args.accounts, args.instruments, args.disorder, args.seed)
+    print(f"Wrote synthetic inputs to {args.out}")
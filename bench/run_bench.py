@@ -0,0 +1,147 @@
+import argparse
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from generate_data import FILLS_CSV, TRANSFERS_CSV, generate
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+BASELINE_JSON = "baseline.json"
+TOLERANCE = 0.2 # регрессия - rows/s упал или peak RSS вырос больше чем на TOLERANCE от baseline
+
+# (ключ, папка задачи, скрипт, входной CSV для rows/s, коды выхода без ошибки).
+# стадии запускаются по порядку - каждая читает выход предыдущей, как в pipeline.py.
+# валидаторы выходят с кодом 1, если нашли проблемы - для бенчмарка это не ошибка
+STAGES = [
+    ("filter_funding_rows", "task 1", "filter_funding_rows.py", TRANSFERS_CSV, (0,)),
+    ("validate_funding", "task 1", "validate_data.py", "funding_transfers.csv", (0, 1)),
+    ("filter_om_funding", "task 1", "filter_om_funding.py", "funding_transfers.csv", (0,)),
+    ("om_funding_totals", "task 1", "calculate_om_funding_totals.py", "funding_transfers_OM.csv", (0,)),
+    ("validate_fills", "task 2", "validate_data.py", FILLS_CSV, (0, 1)),
+    ("find_pnl", "task 2", "find_PnL.py", FILLS_CSV, (0,)),
+]
+
+# бенчмарк стадий обеих задач на синтетических данных (generate_data.py): для каждой стадии - wall time,
+# rows/s по её входному CSV и peak RSS процесса стадии. каждая стадия - отдельный процесс, так что RSS
+# не смешивается между стадиями. скрипты задачи копируются в рабочую папку рядом с данными, как в README задач
+
+def count_rows(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return sum(1 for _ in csv.reader(f)) - 1
+
+# запускает скрипт в cwd, возвращает (код выхода, секунды, peak RSS в МБ или None, если ОС не даёт rusage)
+def run_stage(script, cwd, args=()):
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, script, *args], cwd=cwd, stdout=subprocess.DEVNULL)
+    if hasattr(os, "wait4"):
+        _pid, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        peak_rss_mb = usage.ru_maxrss / 1024 # ru_maxrss на Linux - в КБ
+    else:
+        proc.wait()
+        peak_rss_mb = None
+    return proc.returncode, time.perf_counter() - start, peak_rss_mb
+
+def prepare_workdir(data_dir, work_dir):
+    for task in ("task 1", "task 2"):
+        dst = os.path.join(work_dir, task)
+        os.makedirs(dst, exist_ok=True)
+        for script in (REPO_DIR / task).glob("*.py"):
+            shutil.copy(script, dst)
+        for name in os.listdir(data_dir):
+            shutil.copy(os.path.join(data_dir, name), dst)
+
+# repeat - сколько раз гонять каждую стадию; в результат идёт самый быстрый прогон (меньше шума)
+def run_benchmarks(data_dir, work_dir, repeat=1, stages=None):
+    prepare_workdir(data_dir, work_dir)
+    results = {}
+    for key, task, script, input_csv, ok_codes in STAGES:
+        cwd = os.path.join(work_dir, task)
+        if stages and key not in stages: # стадию всё равно гоняем один раз - её выход нужен следующим
+            run_stage(script, cwd)
+            continue
+        rows = count_rows(os.path.join(cwd, input_csv))
+        best = None
+        for _ in range(repeat):
+            code, seconds, peak_rss_mb = run_stage(script, cwd)
+            if code not in ok_codes:
+                raise SystemExit(f"{task}/{script} failed with exit code {code}")
+            if best is None or seconds < best[0]:
+                best = (seconds, peak_rss_mb)
+        seconds, peak_rss_mb = best
+        results[key] = {
+            "rows": rows,
+            "wall_s": round(seconds, 4),
+            "rows_per_s": round(rows / seconds, 1) if seconds else None,
+            "peak_rss_mb": round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+        }
+    return results
+
+# список (стадия, что ухудшилось) относительно baseline
+def find_regressions(results, baseline, tolerance=TOLERANCE):
+    regressions = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if base.get("rows_per_s") and cur["rows_per_s"] is not None and cur["rows_per_s"] < base["rows_per_s"] * (1 - tolerance):
+            regressions.append((key, f"rows/s {cur['rows_per_s']:.0f} < baseline {base['rows_per_s']:.0f}"))
+        if base.get("peak_rss_mb") and cur["peak_rss_mb"] is not None and cur["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append((key, f"peak RSS {cur['peak_rss_mb']:.1f} MB > baseline {base['peak_rss_mb']:.1f} MB"))
+    return regressions
+
+def print_results(results):
+    print(f"{'stage':<22}{'rows':>10}{'wall s':>10}{'rows/s':>12}{'peak MB':>10}")
+    for key, r in results.items():
+        rss = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "-"
+        print(f"{key:<22}{r['rows']:>10}{r['wall_s']:>10.3f}{r['rows_per_s']:>12.0f}{rss:>10}")
+
+def write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the task 1 / task 2 stages on synthetic data")
+    parser.add_argument("--data", help="directory with inputs from generate_data.py (generated into a temp dir if omitted)")
+    parser.add_argument("--transfers", type=int, default=100_000, help="transfers rows to generate when --data is omitted")
+    parser.add_argument("--fills", type=int, default=100_000, help="fills rows to generate when --data is omitted")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage, the fastest one is reported")
+    parser.add_argument("--stages", nargs="+", choices=[s[0] for s in STAGES], help="only report these stages (earlier stages still run once to produce their inputs)")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    parser.add_argument("--baseline", default=str(Path(__file__).resolve().parent / BASELINE_JSON), help="baseline JSON to compare with (skipped if missing)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed relative slowdown / RSS growth before flagging a regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="qb_bench_") as tmp:
+        data_dir = args.data
+        if data_dir is None:
+            data_dir = os.path.join(tmp, "data")
+            generate(data_dir, transfers=args.transfers, fills=args.fills, seed=args.seed)
+        results = run_benchmarks(data_dir, os.path.join(tmp, "work"), args.repeat, args.stages)
+
+    print_results(results)
+    if args.output:
+        write_json(args.output, results)
+    if args.save_baseline:
+        write_json(args.baseline, results)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for key, message in regressions:
+            print(f"REGRESSION {key}: {message}")
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regressions against {args.baseline}")
@@ -0,0 +1,66 @@
+import argparse
+import csv
+from collections import defaultdict
+
+from calculate_om_funding_totals import ACCOUNTS_CSV, FUNDING_CONVERTERS, add_amount, exchange_for, get_row_amount_and_sign, load_account_to_exchange, new_totals, print_totals
+from filter_om_funding import INSTRUMENTS_CSV, get_instrument_candidates
+from instrument_index import INDEX_JSON, load_instrument_index, resolve_asset
+from json_fields import PAYLOAD_CONVERTERS
+from records import RecordReader
+from textio import open_text
+
+INPUT_CSV = "funding_transfers.csv"
+OUTPUT_CSV = "funding_totals_by_asset.csv"
+COLUMNS = ("account_id", "amount", "side", "info", "response")
+
+# за один проход по funding_transfers.csv (все строки фандинга, не только OM) считает итоги биржа × актив.
+# актив строки определяется по индексу инструментов (instrument_index.py), assets - необязательный фильтр
+def compute_totals(index, account_to_exchange, assets=None, contract_type="perpetual", path=INPUT_CSV):
+    by_asset = defaultdict(new_totals)
+    unresolved = 0
+    converters = dict(FUNDING_CONVERTERS, **PAYLOAD_CONVERTERS)
+    with open_text(path) as f:
+        for a_id, amount, side, info, response in RecordReader(f, COLUMNS, converters=converters):
+            hint = account_to_exchange.get(a_id, {}).get("exchange", "").strip() # биржа аккаунта для неоднозначных имён
+            asset = resolve_asset(get_instrument_candidates(info, response), index, contract_type, hint)
+            if asset is None:
+                unresolved += 1
+                continue
+            if assets and asset not in assets:
+                continue
+            amount, sign = get_row_amount_and_sign(response, amount, side)
+            add_amount(by_asset[asset][exchange_for(account_to_exchange, a_id)], amount, sign)
+    return by_asset, unresolved
+
+# пишет итоги в CSV: одна строка на пару актив × биржа
+def write_totals(by_asset, path=OUTPUT_CSV):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["asset", "exchange", "paid", "count_paid", "received", "count_received", "net", "skipped"])
+        for asset in sorted(by_asset):
+            for exchange_name, st in sorted(by_asset[asset].items()):
+                w.writerow([asset, exchange_name, round(st["paid"], 8), st["count_paid"], round(st["received"], 8), st["count_received"],
+                            round(st["received"] - st["paid"], 8), st["skipped"]])
+
+def main():
+    parser = argparse.ArgumentParser(description="Funding totals by exchange for every asset in one pass")
+    parser.add_argument("--assets", default="", help="comma-separated asset_base filter, e.g. OM,BTC (default: all assets)")
+    parser.add_argument("--contract-type", default="perpetual")
+    parser.add_argument("--output", default=OUTPUT_CSV, help="CSV with asset x exchange totals")
+    parser.add_argument("--rebuild-index", action="store_true", help=f"reparse {INSTRUMENTS_CSV} even if {INDEX_JSON} is up to date")
+    args = parser.parse_args()
+
+    assets = {a.strip().upper() for a in args.assets.split(",") if a.strip()}
+    index = load_instrument_index(rebuild=args.rebuild_index)
+    account_to_exchange = load_account_to_exchange(ACCOUNTS_CSV)
+    by_asset, unresolved = compute_totals(index, account_to_exchange, assets, args.contract_type.lower())
+
+    for asset in sorted(by_asset):
+        print_totals(by_asset[asset], f"{asset} funding totals by exchange")
+    if unresolved:
+        print(f"Rows with no {args.contract_type} instrument in {INSTRUMENTS_CSV}: {unresolved}")
+    write_totals(by_asset, args.output)
+    print(f"Wrote {sum(len(v) for v in by_asset.values())} asset x exchange rows to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,37 @@
+import argparse
 import csv
+import hashlib
 import json
+import os
 from collections import defaultdict
 
+import metrics
+from csv_chunks import CompleteRecords
+from json_fields import LazyJson
+from records import RecordReader, lenient
+from textio import is_compressed, open_text
+
 FUNDING_CSV = "funding_transfers_OM.csv"
 ACCOUNTS_CSV = "accounts to exchanges.csv"
+STATE_JSON = "funding_totals_state.json"
 PNL_KEYS = ("pnl", "balChg", "realized_pnl", "transaction_cost", "income", "change", "funding")
+FUNDING_COLUMNS = ("account_id", "amount", "side", "response")
+TOTALS_VERSION = 2 # меняется вместе с правилами подсчёта (2 - строки без знака идут в skipped), сбрасывает чекпоинт --incremental
+# account_id обязателен, amount/side нужны только если пнл в response не нашёлся - поэтому пустые/кривые становятся None
+FUNDING_CONVERTERS = {"account_id": int, "amount": lenient(float), "side": lenient(int), "response": LazyJson}
 
 # читает CSV аккаунтов и возвращает словарь: id аккаунта -> {exchange}
 def load_account_to_exchange(path):
     out = {}
-    with open(path, "r", encoding="utf-8", newline="") as f:
-        for row in csv.DictReader(f):
-            a_id = (row.get("id")).strip()
-            out[int(a_id)] = {"exchange": (row.get("exchange")).strip()}
+    with open_text(path) as f:
+        for a_id, exchange in RecordReader(f, ("id", "exchange"), converters={"id": int}):
+            out[a_id] = {"exchange": exchange}
     return out
 
 # возвращает сумму и знак. в первую очередь проверяет пнл/аналоги, если таковых нет - использует amount * side для количества и side для знака
-def get_row_amount_and_sign(row):
-    # ищем пнл в response
-    raw = (row.get("response")).strip()
-    data = json.loads(raw)
+def get_row_amount_and_sign(response, amount, side):
+    # ищем пнл в response (LazyJson: достаём только PNL_KEYS, без полного разбора, если получится)
+    data = response.get_many(PNL_KEYS)
     for key in PNL_KEYS:
         val = data.get(key)
         if val is None or val == "":
@@ -31,34 +43,40 @@ def get_row_amount_and_sign(row):
         except (TypeError, ValueError):
             pass
     # если пнл не найден в response мы строим его самостоятельно, используя эмаунт и сайд:
-    v = float((row.get("amount")).strip())
-    if v != 0:
-        amt = abs(v)
-        sign = int(row.get("side"))
-        return (amt, sign) if sign is not None else (amt, None)
+    if amount:
+        return abs(amount), side
     return None, None
 
-# читает funding_transfers_OM.csv, берет направление транзакции, группирует по бирже
-def main():
-    account_to_exchange = load_account_to_exchange(ACCOUNTS_CSV)
-    by_exchange = defaultdict(lambda: {"paid": 0.0, "received": 0.0, "count_paid": 0, "count_received": 0, "skipped": 0})
-
-    with open(FUNDING_CSV, "r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            a_id = int((row.get("account_id")).strip())
-            exchange = account_to_exchange.get(a_id)
-            exchange_name = (exchange.get("exchange")).strip()
-
-            amount, sign = get_row_amount_and_sign(row)
-            if sign == -1:
-                by_exchange[exchange_name]["paid"] += amount
-                by_exchange[exchange_name]["count_paid"] += 1
-            else:
-                by_exchange[exchange_name]["received"] += amount
-                by_exchange[exchange_name]["count_received"] += 1
-
-    print("OM funding totals by exchange")
+# пустые итоги по биржам: для каждой биржи суммы и количество строк paid/received
+def new_totals():
+    return defaultdict(lambda: {"paid": 0.0, "received": 0.0, "count_paid": 0, "count_received": 0, "skipped": 0})
+
+# имя биржи аккаунта из load_account_to_exchange
+def exchange_for(account_to_exchange, a_id):
+    exchange = account_to_exchange.get(a_id)
+    return (exchange.get("exchange")).strip()
+
+# добавляет сумму со знаком в одну ячейку итогов (элемент new_totals()). строка без суммы или без знака
+# (пустой/кривой side стал None, side вне {1, -1}) идёт в skipped, а не в received
+def add_amount(st, amount, sign):
+    if amount is None or sign not in (1, -1):
+        st["skipped"] += 1
+    elif sign == -1:
+        st["paid"] += amount
+        st["count_paid"] += 1
+    else:
+        st["received"] += amount
+        st["count_received"] += 1
+
+# добавляет одну строку фандинга в итоги по бирже аккаунта (record - кортеж в порядке FUNDING_COLUMNS)
+def add_row(by_exchange, account_to_exchange, record):
+    a_id, amount, side, response = record
+    amount, sign = get_row_amount_and_sign(response, amount, side)
+    add_amount(by_exchange[exchange_for(account_to_exchange, a_id)], amount, sign)
+
+# печатает итоги по биржам и общий итог
+def print_totals(by_exchange, title="OM funding totals by exchange"):
+    print(title)
     total_paid = 0.0
     total_received = 0.0
     for exchange_name in sorted(by_exchange.keys()):
@@ -78,5 +96,121 @@ def main():
     print(f"  Net funding:    {total_received - total_paid:>15.4f}")
     print()
 
+# счётчики шага для metrics: все строки = учтённые + пропущенные (без суммы или знака)
+def report_counts(by_exchange):
+    kept = sum(st["count_paid"] + st["count_received"] for st in by_exchange.values())
+    skipped = sum(st["skipped"] for st in by_exchange.values())
+    metrics.report(rows_read=kept + skipped, rows_kept=kept)
+
+# читает funding_transfers_OM.csv, берет направление транзакции, группирует по бирже
+def main():
+    account_to_exchange = load_account_to_exchange(ACCOUNTS_CSV)
+    by_exchange = new_totals()
+
+    with open_text(FUNDING_CSV) as f:
+        for record in RecordReader(f, FUNDING_COLUMNS, converters=FUNDING_CONVERTERS):
+            add_row(by_exchange, account_to_exchange, record)
+
+    report_counts(by_exchange)
+    print_totals(by_exchange)
+
+# инкрементальный режим. выгрузка только дописывается, поэтому итоги сохраняются в STATE_JSON вместе с чекпоинтом:
+# смещение конца последней учтённой строки и sha1 заголовка и самой этой строки. следующий запуск проверяет чекпоинт
+# и считает только дописанные строки; если файл укоротили или переписали (отпечатки не совпали), или поменялся
+# ACCOUNTS_CSV / PNL_KEYS - итоги пересчитываются с нуля
+
+def _sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+def _config_stamp():
+    st = os.stat(ACCOUNTS_CSV)
+    return {"accounts_size": st.st_size, "accounts_mtime_ns": st.st_mtime_ns, "pnl_keys": list(PNL_KEYS), "totals_version": TOTALS_VERSION}
+
+def load_state(path=STATE_JSON):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_state(state, path=STATE_JSON):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+# возвращает None, если с чекпоинта можно продолжать, иначе причину полного пересчёта
+def checkpoint_mismatch(state, f, header):
+    if state is None:
+        return "no saved state"
+    if state.get("source") != FUNDING_CSV or state.get("config") != _config_stamp():
+        return "source file, accounts or PNL_KEYS changed"
+    if state["header_sha1"] != _sha1(header):
+        return "header changed"
+    size = f.seek(0, os.SEEK_END)
+    if size < state["offset"]:
+        return "file was truncated"
+    if state["last_row_sha1"] is not None:
+        f.seek(state["last_row_start"])
+        if _sha1(f.read(state["offset"] - state["last_row_start"])) != state["last_row_sha1"]:
+            return "file was rewritten"
+    return None
+
+def main_incremental(state_path=STATE_JSON):
+    if is_compressed(FUNDING_CSV): # чекпоинт - байтовое смещение в несжатом файле
+        print(f"{FUNDING_CSV} is compressed, computing the totals from scratch")
+        return main()
+    account_to_exchange = load_account_to_exchange(ACCOUNTS_CSV)
+    state = load_state(state_path)
+    with open(FUNDING_CSV, "rb") as f:
+        header_records = CompleteRecords(f, 0)
+        fieldnames = next(csv.reader(header_records), None)
+        if fieldnames is None:
+            raise ValueError("CSV has no header")
+        header = header_records.last_record
+
+        reason = checkpoint_mismatch(state, f, header)
+        by_exchange = new_totals()
+        if reason is None:
+            start = state["offset"]
+            for exchange_name, st in state["totals"].items():
+                by_exchange[exchange_name].update(st)
+            last_row_start, last_row_sha1 = state["last_row_start"], state["last_row_sha1"]
+            print(f"Resuming {FUNDING_CSV} from byte {start}")
+        else:
+            start = len(header)
+            last_row_start, last_row_sha1 = None, None
+            print(f"Full rebuild of {FUNDING_CSV}: {reason}")
+
+        records = CompleteRecords(f, start)
+        count = 0
+        for record in RecordReader(records, FUNDING_COLUMNS, converters=FUNDING_CONVERTERS, fieldnames=fieldnames):
+            add_row(by_exchange, account_to_exchange, record)
+            count += 1
+        if records.last_record is not None:
+            last_row_start = records.end - len(records.last_record)
+            last_row_sha1 = _sha1(records.last_record)
+        tail = f.seek(0, os.SEEK_END) - records.end
+
+    metrics.report(rows_read=count)
+    print(f"Processed {count} new rows")
+    if tail:
+        print(f"Left {tail} trailing bytes of an incomplete row for the next run")
+    save_state({
+        "source": FUNDING_CSV,
+        "config": _config_stamp(),
+        "header_sha1": _sha1(header),
+        "offset": records.end,
+        "last_row_start": last_row_start,
+        "last_row_sha1": last_row_sha1,
+        "totals": by_exchange,
+    }, state_path)
+    print_totals(by_exchange)
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true", help=f"resume from the checkpoint in {STATE_JSON} and only process appended rows")
+    args = parser.parse_args()
+    if args.incremental:
+        main_incremental()
+    else:
+        main()
@@ -0,0 +1,94 @@
+import io
+
+BLOCK_SIZE = 1 << 22
+CHUNK_SIZE = 1 << 25
+
+# делит CSV на байтовые диапазоны, которые начинаются и заканчиваются на границе записи.
+# в info/response лежит JSON с переносами строк внутри кавычек, поэтому граница - это не любой \n,
+# а только \n, перед которым чётное число кавычек от начала файла ("" внутри поля чётность не меняет)
+
+# ищет первую границу записи после каждого из offsets (отсортированы по возрастанию), возвращает список позиций
+def find_record_boundaries(f, offsets):
+    boundaries = []
+    targets = iter(offsets)
+    target = next(targets, None)
+    parity = 0
+    pos = 0
+    f.seek(0)
+    while target is not None:
+        block = f.read(BLOCK_SIZE)
+        if not block:
+            break
+        end = pos + len(block)
+        scanned = 0 # до какой позиции в block посчитана parity
+        while target is not None and target < end:
+            j = max(target - pos, scanned)
+            parity ^= block.count(b'"', scanned, j) & 1
+            scanned = j
+            found = None
+            while True:
+                nl = block.find(b"\n", j)
+                if nl == -1:
+                    break
+                parity ^= block.count(b'"', scanned, nl) & 1
+                scanned = nl
+                if not parity:
+                    found = nl + 1
+                    break
+                j = nl + 1
+            if found is None: # граница не нашлась в этом блоке - ищем дальше в следующем
+                break
+            if not boundaries or boundaries[-1] != pos + found:
+                boundaries.append(pos + found)
+            while target is not None and target < pos + found:
+                target = next(targets, None)
+        parity ^= block.count(b'"', scanned) & 1
+        pos = end
+    return boundaries
+
+# возвращает (конец заголовка, [(start, end), ...]) - диапазоны записей примерно по chunk_size байт
+def split_ranges(path, chunk_size=CHUNK_SIZE, start=None):
+    with open(path, "rb") as f:
+        size = f.seek(0, io.SEEK_END)
+        header_end = find_record_boundaries(f, [0])
+        header_end = header_end[0] if header_end else size
+        first = header_end if start is None else start
+        offsets = list(range(first + chunk_size, size, chunk_size))
+        bounds = [b for b in find_record_boundaries(f, offsets) if b > first]
+    edges = [first] + [b for b in bounds if b < size] + [size]
+    ranges = [(a, b) for a, b in zip(edges, edges[1:]) if b > a]
+    return header_end, ranges
+
+# читает диапазон [start, end) файла как текст (границы всегда на \n, так что UTF-8 не режется)
+def read_range_text(path, start, end, encoding="utf-8"):
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return io.StringIO(data.decode(encoding), newline="")
+
+# читает полные записи файла, начиная с границы записи start. строки отдаются по одной (для csv.reader),
+# но только когда вся запись дочитана до \n с чётным числом кавычек - недописанный хвост файла не трогается.
+# после каждой записи end и last_record указывают на её конец и байты (для чекпоинта)
+class CompleteRecords:
+    def __init__(self, f, start, encoding="utf-8"):
+        self.f = f
+        self.encoding = encoding
+        self.end = start
+        self.last_record = None
+
+    def __iter__(self):
+        self.f.seek(self.end)
+        pending = []
+        parity = 0
+        for line in self.f:
+            if not line.endswith(b"\n"):
+                break
+            pending.append(line)
+            parity ^= line.count(b'"') & 1
+            if parity:
+                continue
+            self.last_record = b"".join(pending)
+            self.end += len(self.last_record)
+            for part in pending:
+                yield part.decode(self.encoding)
+            pending = []
@@ -1,33 +1,87 @@
+import argparse
 import csv
+import io
+from multiprocessing import Pool
+
+import metrics
+from csv_chunks import CHUNK_SIZE, read_range_text, split_ranges
+from records import RecordReader
+from textio import is_compressed, open_output, open_text, output_path
 
 INPUT_CSV = "BSGDATA_public_data_transfers.csv"
 OUTPUT_CSV = "funding_transfers.csv"
+KEY_COLUMNS = ("type_exch", "type_id")
 
-# возвращает True если строка — трансфер по фандингу
-def should_keep_row(row):
-    type_exch = (row.get("type_exch")).strip()
-    type_id_raw = row.get("type_id")
-    type_id = str(type_id_raw).strip() if type_id_raw is not None else ""
+# возвращает True если строка — трансфер по фандингу (type_exch и type_id уже без пробелов по краям)
+def should_keep_row(type_exch, type_id):
     if type_exch.upper() == "FUNDING":
         return True
     if type_id == "405":
         return True
     return False
 
-# читает data_transfers CSV, оставляет только строки по фандингу, записывает их в OUTPUT_CSV.
-def main():
+# фильтрует один байтовый диапазон INPUT_CSV в отдельном процессе, возвращает (готовый CSV-текст, число оставленных строк, число прочитанных)
+def filter_range(task):
+    path, fieldnames, start, end = task
+    out = io.StringIO(newline="")
+    writer = csv.writer(out)
+    # у диапазона нет своего заголовка - подставляем заголовок файла
+    reader = RecordReader(read_range_text(path, start, end), KEY_COLUMNS, fieldnames=fieldnames)
+    count = 0
+    rows = 0
+    for rows, (raw, (type_exch, type_id)) in enumerate(reader.pairs(), start=1):
+        if should_keep_row(type_exch, type_id):
+            writer.writerow(raw)
+            count += 1
+    return out.getvalue(), count, rows
+
+# параллельный режим: файл режется на диапазоны по границам записей, диапазоны фильтруются в пуле процессов,
+# результаты пишутся в OUTPUT_CSV в исходном порядке строк. сжатый вход по смещениям не режется - тогда обычный проход
+def main_parallel(workers, chunk_size=CHUNK_SIZE, compress=None):
+    if is_compressed(INPUT_CSV):
+        print(f"{INPUT_CSV} is compressed, filtering in a single process")
+        return main(compress)
+    header_end, ranges = split_ranges(INPUT_CSV, chunk_size)
     with open(INPUT_CSV, "r", encoding="utf-8", newline="") as fin:
-        reader = csv.DictReader(fin)
-        fieldnames = reader.fieldnames
-        with open(OUTPUT_CSV, "w", encoding="utf-8", newline="") as fout:
-            writer = csv.DictWriter(fout, fieldnames=fieldnames)
-            writer.writeheader()
+        fieldnames = next(csv.reader(fin), None)
+    if fieldnames is None:
+        raise ValueError("CSV has no header")
+    tasks = [(INPUT_CSV, fieldnames, start, end) for start, end in ranges]
+    count = 0
+    rows = 0
+    with open_output(OUTPUT_CSV, compress) as fout:
+        csv.writer(fout).writerow(fieldnames)
+        with Pool(workers) as pool:
+            for text, n, chunk_rows in pool.imap(filter_range, tasks):
+                fout.write(text)
+                count += n
+                rows += chunk_rows
+    metrics.report(rows_read=rows, rows_kept=count, rows_written=count)
+    print(f"Wrote {count} matching rows to {output_path(OUTPUT_CSV, compress)} ({len(ranges)} chunks, {workers} workers)")
+
+# читает data_transfers CSV, оставляет только строки по фандингу, записывает их в OUTPUT_CSV.
+# compress - "gz" / "bz2" / "xz": писать сжатый OUTPUT_CSV (textio.py)
+def main(compress=None):
+    with open_text(INPUT_CSV) as fin:
+        reader = RecordReader(fin, KEY_COLUMNS)
+        with open_output(OUTPUT_CSV, compress) as fout:
+            writer = csv.writer(fout)
+            writer.writerow(reader.fieldnames)
             count = 0
-            for row in reader:
-                if should_keep_row(row):
-                    writer.writerow(row)
+            rows = 0
+            for rows, (raw, (type_exch, type_id)) in enumerate(reader.pairs(), start=1):
+                if should_keep_row(type_exch, type_id):
+                    writer.writerow(raw)
                     count += 1
-    print(f"Wrote {count} matching rows to {OUTPUT_CSV}")
+    metrics.report(rows_read=rows, rows_kept=count, rows_written=count)
+    print(f"Wrote {count} matching rows to {output_path(OUTPUT_CSV, compress)}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=0, help="number of worker processes (0 - single-process scan)")
+    parser.add_argument("--compress", choices=("gz", "bz2", "xz"), help="write the output compressed")
+    args = parser.parse_args()
+    if args.workers > 0:
+        main_parallel(args.workers, compress=args.compress)
+    else:
+        main(args.compress)
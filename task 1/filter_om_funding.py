@@ -1,23 +1,30 @@
+import argparse
 import csv
 import json
 
+import metrics
+from json_fields import PAYLOAD_CONVERTERS
+from records import RecordReader
+from textio import open_output, open_text, output_path
+
 INPUT_CSV = "funding_transfers.csv"
 OUTPUT_CSV = "funding_transfers_OM.csv"
 INSTRUMENTS_CSV = "BSGDATA_public_statichange_instruments_v2.csv"
+INSTRUMENT_COLUMNS = ("asset_base", "contract_type", "instrument_exch", "instrument_bender")
+PAYLOAD_COLUMNS = ("info", "response")
+INSTRUMENT_KEYS = ("symbol", "instrument_name", "instId")
 
 # загружает все инструменты из instruments_v2.csv и возвращает только те, которые asset_base=OM, contract_type=perpetual
 # есть ещё контракт типа futures, но их количество для asset_base=OM равно нулю 
 def load_om_perp_symbols():
     seen = set()
-    with open(INSTRUMENTS_CSV, "r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if (row.get("asset_base")).strip().upper() != "OM":
+    with open_text(INSTRUMENTS_CSV) as f:
+        for asset_base, contract_type, *names in RecordReader(f, INSTRUMENT_COLUMNS):
+            if asset_base.upper() != "OM":
                 continue
-            if (row.get("contract_type")).strip().lower() != "perpetual":
+            if contract_type.lower() != "perpetual":
                 continue
-            for col in ("instrument_exch", "instrument_bender"):
-                val = (row.get(col)).strip()
+            for val in names:
                 if val:
                     seen.add(val)
                     seen.add(normalize_symbol(val))
@@ -37,55 +44,59 @@ def is_om_instrument(s, om_perp_symbols):
     norm = normalize_symbol(raw)
     return raw in om_perp_symbols or norm in om_perp_symbols
 
-# собирает идентификаторы инструментов из info и response
+# собирает идентификаторы инструментов из info и response (оба - LazyJson, см. json_fields.py)
 def get_instrument_candidates(info_val, response_val):
     candidates = []
-    for val in (info_val, response_val):
-        if not val or not isinstance(val, str):
-            continue
-        raw = val.strip()
-        if not raw:
+    for payload in (info_val, response_val):
+        if not payload:
             continue
+        raw = payload.raw
         if raw.startswith("{"):
             try:
-                data = json.loads(raw)
-                for key in ("symbol", "instrument_name", "instId"):
-                    val = data.get(key)
-                    if val and isinstance(val, str):
-                        candidates.append(val.strip())
-            except (json.JSONDecodeError, TypeError):
-                pass
+                fields = payload.get_many(INSTRUMENT_KEYS)
+            except json.JSONDecodeError:
+                continue
+            for key in INSTRUMENT_KEYS:
+                val = fields.get(key)
+                if val and isinstance(val, str):
+                    candidates.append(val.strip())
         else:
             candidates.append(raw)
     return candidates
 
 # возвращает True, если инструмент строки вытянутый из info/response входит в список instruments_v2.csv(asset_base=OM, contract_type=perpetual)
-def row_has_om(row, om_perp_symbols):
-    info_val = row.get("info")
-    response_val = row.get("response")
+def row_has_om(info_val, response_val, om_perp_symbols):
     for cand in get_instrument_candidates(info_val, response_val):
         if is_om_instrument(cand, om_perp_symbols):
             return True
     return False
 
 # читает funding_transfers.csv, оставляет только строки asset_base=OM, contract_type=perpetual, записывает funding_transfers_OM.csv.
-def main():
+# compress - "gz" / "bz2" / "xz": писать сжатый OUTPUT_CSV (textio.py). output - писать в этот путь вместо OUTPUT_CSV
+# (pipeline.py пишет во временный файл, пока идёт проверка данных)
+def main(compress=None, output=None):
+    output = output or OUTPUT_CSV
     om_perp_symbols = load_om_perp_symbols()
     print(f"Loaded {len(om_perp_symbols)} OM perpetual symbol forms from {INSTRUMENTS_CSV}")
-    with open(INPUT_CSV, "r", encoding="utf-8", newline="") as fin:
-        reader = csv.DictReader(fin)
-        fieldnames = reader.fieldnames
-        if fieldnames is None:
+    with open_text(INPUT_CSV) as fin:
+        reader = RecordReader(fin, PAYLOAD_COLUMNS, converters=PAYLOAD_CONVERTERS)
+        if reader.fieldnames is None:
             raise ValueError("CSV has no header")
-        with open(OUTPUT_CSV, "w", encoding="utf-8", newline="") as fout:
-            writer = csv.DictWriter(fout, fieldnames=fieldnames)
-            writer.writeheader()
+        with open_output(output, compress) as fout:
+            writer = csv.writer(fout)
+            writer.writerow(reader.fieldnames)
             count = 0
-            for row in reader:
-                if row_has_om(row, om_perp_symbols):
-                    writer.writerow(row)
+            rows = 0
+            for rows, (raw, (info_val, response_val)) in enumerate(reader.pairs(), start=1):
+                if row_has_om(info_val, response_val, om_perp_symbols):
+                    writer.writerow(raw)
                     count += 1
-    print(f"Wrote {count} OM funding rows to {OUTPUT_CSV}")
+    metrics.report(rows_read=rows, rows_kept=count, rows_written=count)
+    print(f"Wrote {count} OM funding rows to {output_path(output, compress)}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--compress", choices=("gz", "bz2", "xz"), help="write the output compressed")
+    parser.add_argument("--output", default=OUTPUT_CSV, help="CSV to write the OM funding rows to")
+    args = parser.parse_args()
+    main(args.compress, args.output)
@@ -0,0 +1,271 @@
+import argparse
+import csv
+import json
+import math
+import os
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from calculate_om_funding_totals import ACCOUNTS_CSV, FUNDING_CONVERTERS, get_row_amount_and_sign, load_account_to_exchange
+from filter_om_funding import INSTRUMENTS_CSV, get_instrument_candidates, normalize_symbol
+from instrument_index import load_instrument_index, resolve_asset
+from json_fields import PAYLOAD_CONVERTERS
+from records import RecordReader, lenient
+from textio import open_text, resolve_input
+
+INPUT_CSV = "funding_transfers.csv"
+STORE_DIR = "funding_store.cache"
+STORE_VERSION = 3
+STORE_COLUMNS = ("account_id", "amount", "side", "info", "response")
+TS_COLUMN = "ts" # необязательная колонка: без неё фильтры по времени не работают
+EPOCH = datetime(1970, 1, 1)
+MINUTE = timedelta(minutes=1)
+NO_TS = -1 # в колонке ts - у строки нет времени (или оно не разбирается)
+GROUP_FIELDS = ("account", "exchange", "asset", "instrument")
+
+COLUMN_TYPES = {
+    "account": "q",
+    "exchange": "i",
+    "asset": "i",
+    "instrument": "i",
+    "amount": "d", # со знаком: < 0 - paid, > 0 - received, nan - нет суммы или знака (skipped в итогах)
+    "ts": "q",
+}
+
+# хранилище строк фандинга для запросов без повторного чтения CSV.
+# funding_transfers.csv разбирается один раз: аккаунт, биржа (через load_account_to_exchange), инструмент
+# (первый кандидат из info/response после normalize_symbol), актив (instrument_index.resolve_asset) и сумма со знаком
+# (get_row_amount_and_sign) ложатся в колонки array, строки - в словари id. по аккаунту, бирже и активу строятся
+# индексы: значение -> array номеров строк, так что запрос просматривает только строки самого узкого фильтра.
+# колонки сохраняются в STORE_DIR и перечитываются, пока не поменялись funding_transfers.csv,
+# accounts to exchanges.csv, instruments_v2.csv и contract_type
+
+# время со смещением (2023-01-02T00:00+03:00) переводится в UTC, без смещения - считается UTC
+def ts_to_minutes(value):
+    t = datetime.fromisoformat(value)
+    if t.tzinfo is not None:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return (t - EPOCH) // MINUTE
+
+def _source_stamp(paths, contract_type):
+    stamp = {"version": STORE_VERSION, "contract_type": contract_type}
+    for path in paths:
+        real = resolve_input(path)
+        st = os.stat(real)
+        stamp[os.path.basename(path)] = {"path": os.path.basename(real), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return stamp
+
+class FundingStore:
+    def __init__(self, columns, exchanges, assets, instruments, has_ts):
+        for name in COLUMN_TYPES:
+            setattr(self, name, columns[name])
+        self.exchanges = exchanges # id -> имя, "" - аккаунта нет в accounts to exchanges.csv
+        self.assets = assets # id -> актив, "" - инструмент не найден в индексе
+        self.instruments = instruments # id -> инструмент, "" - в info/response его нет
+        self.has_ts = has_ts
+        self.rows = len(self.amount)
+        self.by_account = self._index(self.account)
+        self.by_exchange = self._index(self.exchange)
+        self.by_asset = self._index(self.asset)
+
+    @staticmethod
+    def _index(column):
+        index = {}
+        for i, value in enumerate(column):
+            rows = index.get(value)
+            if rows is None:
+                rows = index[value] = array("i")
+            rows.append(i)
+        return index
+
+    # номера строк под фильтры (None - фильтра нет). account - id, exchange/asset - имена (asset без учёта регистра),
+    # since/until - минуты от 1970-01-01, until не включается
+    def select(self, account=None, exchange=None, asset=None, since=None, until=None):
+        candidates = []
+        if account is not None:
+            candidates.append(self.by_account.get(account, ()))
+        if exchange is not None:
+            exchange_id = self.exchanges.index(exchange) if exchange in self.exchanges else None
+            candidates.append(self.by_exchange.get(exchange_id, ()))
+        if asset is not None:
+            asset = asset.upper()
+            asset_id = self.assets.index(asset) if asset in self.assets else None
+            candidates.append(self.by_asset.get(asset_id, ()))
+        if (since is not None or until is not None) and not self.has_ts:
+            raise ValueError(f"{INPUT_CSV} has no {TS_COLUMN} column, time filters are not available")
+
+        rows = min(candidates, key=len) if candidates else range(self.rows)
+        checks = []
+        if account is not None:
+            checks.append((self.account, account))
+        if exchange is not None:
+            checks.append((self.exchange, exchange_id))
+        if asset is not None:
+            checks.append((self.asset, asset_id))
+        ts = self.ts
+        out = array("i")
+        for i in rows:
+            if any(column[i] != value for column, value in checks):
+                continue
+            if since is not None or until is not None:
+                t = ts[i]
+                if t == NO_TS or (since is not None and t < since) or (until is not None and t >= until):
+                    continue
+            out.append(i)
+        return out
+
+    def label(self, field, i):
+        if field == "account":
+            return self.account[i]
+        names = {"exchange": self.exchanges, "asset": self.assets, "instrument": self.instruments}[field]
+        return names[getattr(self, field)[i]]
+
+    # итоги paid/received как в calculate_om_funding_totals (суммы без знака и число строк) по строкам rows.
+    # group_by - одно из GROUP_FIELDS: словарь значение -> итоги, иначе одни итоги
+    def totals(self, rows, group_by=None):
+        out = {}
+        amount = self.amount
+        for i in rows:
+            key = self.label(group_by, i) if group_by else None
+            st = out.get(key)
+            if st is None:
+                st = out[key] = {"paid": 0.0, "received": 0.0, "count_paid": 0, "count_received": 0, "skipped": 0}
+            value = amount[i]
+            if math.isnan(value):
+                st["skipped"] += 1
+            elif value < 0:
+                st["paid"] -= value
+                st["count_paid"] += 1
+            else:
+                st["received"] += value
+                st["count_received"] += 1
+        if group_by:
+            return out
+        return out.get(None, {"paid": 0.0, "received": 0.0, "count_paid": 0, "count_received": 0, "skipped": 0})
+
+    # строки rows в виде словарей (account_id, exchange, asset, instrument, amount, ts)
+    def records(self, rows):
+        for i in rows:
+            ts = self.ts[i]
+            yield {
+                "account_id": self.account[i],
+                "exchange": self.exchanges[self.exchange[i]],
+                "asset": self.assets[self.asset[i]],
+                "instrument": self.instruments[self.instrument[i]],
+                "amount": self.amount[i],
+                "ts": (EPOCH + timedelta(minutes=ts)).isoformat() if ts != NO_TS else "",
+            }
+
+# разбирает funding_transfers.csv в FundingStore
+def build_store(path=INPUT_CSV, accounts_path=ACCOUNTS_CSV, contract_type="perpetual"):
+    index = load_instrument_index()
+    account_to_exchange = load_account_to_exchange(accounts_path)
+    columns = {name: array(code) for name, code in COLUMN_TYPES.items()}
+    exchange_ids, asset_ids, instrument_ids = {}, {}, {}
+    converters = dict(FUNDING_CONVERTERS, **PAYLOAD_CONVERTERS, **{TS_COLUMN: lenient(ts_to_minutes)})
+    with open_text(path) as f:
+        fieldnames = next(csv.reader(f), None) # заголовок читается один раз, колонка ts выбирается по нему
+        if fieldnames is None:
+            raise ValueError("CSV has no header")
+        has_ts = TS_COLUMN in fieldnames
+        reader = RecordReader(f, STORE_COLUMNS + (TS_COLUMN,) if has_ts else STORE_COLUMNS, converters=converters, fieldnames=fieldnames)
+        if reader.missing:
+            raise ValueError(f"{path}: missing columns {reader.missing}")
+        for a_id, amount, side, info, response, *ts in reader:
+            candidates = get_instrument_candidates(info, response)
+            exchange = account_to_exchange.get(a_id, {}).get("exchange", "").strip()
+            asset = resolve_asset(candidates, index, contract_type, exchange) or ""
+            instrument = normalize_symbol(candidates[0]) if candidates else ""
+            amount, sign = get_row_amount_and_sign(response, amount, side)
+            columns["account"].append(a_id)
+            columns["exchange"].append(exchange_ids.setdefault(exchange, len(exchange_ids)))
+            columns["asset"].append(asset_ids.setdefault(asset, len(asset_ids)))
+            columns["instrument"].append(instrument_ids.setdefault(instrument, len(instrument_ids)))
+            columns["amount"].append(math.nan if amount is None or sign not in (1, -1) else amount * sign)
+            columns["ts"].append(ts[0] if ts and ts[0] is not None else NO_TS)
+    return FundingStore(columns, list(exchange_ids), list(asset_ids), list(instrument_ids), has_ts)
+
+def save_store(store, stamp, store_dir=STORE_DIR):
+    os.makedirs(store_dir, exist_ok=True)
+    meta_path = os.path.join(store_dir, "meta.json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    for name in COLUMN_TYPES:
+        with open(os.path.join(store_dir, name), "wb") as out:
+            getattr(store, name).tofile(out)
+    meta = {
+        "source": stamp,
+        "rows": store.rows,
+        "exchanges": store.exchanges,
+        "assets": store.assets,
+        "instruments": store.instruments,
+        "has_ts": store.has_ts,
+    }
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        json.dump(meta, out)
+    os.replace(tmp_path, meta_path) # meta.json пишется последним: без него хранилище считается недостроенным
+
+# None, если сохранённого хранилища нет или оно построено по другим версиям файлов
+def open_store(stamp, store_dir=STORE_DIR):
+    meta_path = os.path.join(store_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("source") != stamp:
+        return None
+    columns = {}
+    for name, code in COLUMN_TYPES.items():
+        values = array(code)
+        with open(os.path.join(store_dir, name), "rb") as f:
+            values.fromfile(f, meta["rows"])
+        columns[name] = values
+    return FundingStore(columns, meta["exchanges"], meta["assets"], meta["instruments"], meta["has_ts"])
+
+# хранилище из STORE_DIR, если оно актуально, иначе разбирает CSV и сохраняет заново
+def load_store(path=INPUT_CSV, accounts_path=ACCOUNTS_CSV, contract_type="perpetual", store_dir=STORE_DIR, rebuild=False):
+    stamp = _source_stamp((path, accounts_path, INSTRUMENTS_CSV), contract_type)
+    store = None if rebuild else open_store(stamp, store_dir)
+    if store is None:
+        store = build_store(path, accounts_path, contract_type)
+        save_store(store, stamp, store_dir)
+    return store
+
+def print_query_totals(totals, group_by=None):
+    groups = totals if group_by else {"all rows": totals}
+    print(f"{group_by or '':<16}{'paid':>16}{'count':>8}{'received':>16}{'count':>8}{'net':>16}{'skipped':>9}")
+    for key in sorted(groups, key=str):
+        st = groups[key]
+        net = st["received"] - st["paid"]
+        print(f"{str(key):<16}{st['paid']:>16.4f}{st['count_paid']:>8}{st['received']:>16.4f}{st['count_received']:>8}{net:>16.4f}{st['skipped']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query funding rows from an indexed store built once from funding_transfers.csv")
+    parser.add_argument("--account", type=int, help="account_id")
+    parser.add_argument("--exchange", help="exchange name as in accounts to exchanges.csv, e.g. Okex")
+    parser.add_argument("--asset", help="asset_base of the row instrument, e.g. OM")
+    parser.add_argument("--since", help="ISO time, rows at or after it (needs a ts column)")
+    parser.add_argument("--until", help="ISO time, rows before it (needs a ts column)")
+    parser.add_argument("--group-by", choices=GROUP_FIELDS, help="totals per account / exchange / asset / instrument")
+    parser.add_argument("--rows", help="also write the matching rows to this CSV")
+    parser.add_argument("--contract-type", default="perpetual")
+    parser.add_argument("--rebuild", action="store_true", help=f"reparse {INPUT_CSV} even if {STORE_DIR} is up to date")
+    args = parser.parse_args()
+
+    store = load_store(contract_type=args.contract_type.lower(), rebuild=args.rebuild)
+    since = ts_to_minutes(args.since) if args.since else None
+    until = ts_to_minutes(args.until) if args.until else None
+    try:
+        rows = store.select(args.account, args.exchange, args.asset, since, until)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Matched {len(rows)} of {store.rows} rows")
+    print_query_totals(store.totals(rows, args.group_by), args.group_by)
+    if args.rows:
+        with open(args.rows, "w", encoding="utf-8", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=["account_id", "exchange", "asset", "instrument", "amount", "ts"])
+            w.writeheader()
+            w.writerows(store.records(rows))
+        print(f"Wrote {len(rows)} rows to {args.rows}")
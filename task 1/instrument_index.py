@@ -0,0 +1,73 @@
+import csv
+import json
+import os
+
+from filter_om_funding import INSTRUMENTS_CSV, normalize_symbol
+from records import RecordReader
+from textio import open_text, resolve_input
+
+INDEX_JSON = "instrument_index.json"
+INDEX_COLUMNS = ("asset_base", "contract_type", "instrument_exch", "instrument_bender")
+EXCHANGE_COLUMN = "exchange" # в instruments_v2 может не быть - тогда биржа в индексе пустая
+
+# индекс инструментов: имя инструмента (как есть и после normalize_symbol) -> список (asset_base, contract_type, exchange).
+# строится один раз из instruments_v2.csv и сохраняется в INDEX_JSON; при следующих запусках читается оттуда,
+# пока размер и mtime instruments_v2.csv не изменились
+
+def _source_stamp(path):
+    path = resolve_input(path)
+    st = os.stat(path)
+    return {"path": os.path.basename(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+# разбирает instruments_v2.csv в индекс
+def build_instrument_index(path=INSTRUMENTS_CSV):
+    index = {}
+    with open_text(path) as f:
+        fieldnames = next(csv.reader(f), None) # заголовок читается один раз, колонка биржи выбирается по нему
+        columns = INDEX_COLUMNS + (EXCHANGE_COLUMN,) if fieldnames and EXCHANGE_COLUMN in fieldnames else INDEX_COLUMNS
+        reader = RecordReader(f, columns, fieldnames=fieldnames or [])
+        for asset_base, contract_type, *names in reader:
+            exchange = names.pop() if len(names) > 2 else ""
+            meta = [asset_base.upper(), contract_type.lower(), exchange]
+            for val in names:
+                if not val:
+                    continue
+                for key in (val, normalize_symbol(val)):
+                    entries = index.setdefault(key, [])
+                    if meta not in entries:
+                        entries.append(meta)
+    return index
+
+# индекс из INDEX_JSON, если он построен по текущей версии instruments_v2.csv, иначе строит и сохраняет заново
+def load_instrument_index(path=INSTRUMENTS_CSV, index_path=INDEX_JSON, rebuild=False):
+    stamp = _source_stamp(path)
+    if not rebuild and os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("source") == stamp:
+            return saved["index"]
+    index = build_instrument_index(path)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"source": stamp, "index": index}, f)
+    os.replace(tmp_path, index_path)
+    return index
+
+# актив строки по кандидатам из get_instrument_candidates, None - ни один не найден с нужным типом контракта.
+# одно имя может быть у инструментов разных бирж (и в теории с разными активами): если задана exchange (биржа аккаунта),
+# берётся запись этой биржи по любому из кандидатов; если такой нет или exchange не задана (или в instruments_v2 нет
+# колонки exchange) - первая подходящая запись по порядку кандидатов и строк instruments_v2.csv
+def resolve_asset(candidates, index, contract_type="perpetual", exchange=None):
+    exchange = exchange.lower() if exchange else None
+    fallback = None
+    for cand in candidates:
+        raw = cand.strip()
+        for key in (raw, normalize_symbol(raw)):
+            for asset_base, entry_contract_type, entry_exchange in index.get(key, ()):
+                if entry_contract_type != contract_type:
+                    continue
+                if exchange is None or entry_exchange.lower() == exchange:
+                    return asset_base
+                if fallback is None:
+                    fallback = asset_base
+    return fallback
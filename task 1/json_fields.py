@@ -0,0 +1,89 @@
+import json
+import re
+
+# ленивый доступ к полям JSON-объекта из info/response.
+# обычно из payload нужно 1-2 ключа (symbol/instId или pnl/balChg), поэтому у большого плоского объекта (без вложенных
+# объектов/массивов и экранирования) нужные ключи вытаскиваются одним проходом регулярки по строке. всё остальное
+# сразу уходит в json.loads: считать глубину вложенности в питоне дольше, чем полный разбор в C, а на коротких
+# payload'ах json.loads не медленнее регулярки (сравнение - bench/bench_json_fields.py).
+# результат полного разбора кешируется в объекте, так что за прогон каждый payload разбирается максимум один раз
+
+_VALUE_RE = re.compile(r'"([^"]*)"(?=\s*[,}])|(-?(?:0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?)(?=\s*[,}])|(true|false|null)(?=\s*[,}])')
+_LITERALS = {"true": True, "false": False, "null": None}
+EXTRACT_MIN_LEN = 256 # payload'ы короче сразу разбираются json.loads
+_keys_patterns = {}
+
+# одна регулярка на набор ключей: "k1"|"k2"|... перед двоеточием
+def _keys_pattern(keys):
+    pattern = _keys_patterns.get(keys)
+    if pattern is None:
+        pattern = _keys_patterns[keys] = re.compile('"(%s)"\\s*:\\s*' % "|".join(re.escape(k) for k in keys))
+    return pattern
+
+# вытаскивает значения ключей плоского объекта без полного разбора. возвращает dict найденных ключей
+# (отсутствующих ключей в нём нет) или None, если payload не плоский или неоднозначный и нужен json.loads.
+# без экранирования строки - это "..." без кавычек внутри, так что "ключ": не может оказаться внутри строки
+def extract_fields(raw, keys):
+    if "\\" in raw or not raw.startswith("{") or not raw.endswith("}") or raw.count("{") != 1 or "[" in raw:
+        return None
+    out = {}
+    for m in _keys_pattern(tuple(keys)).finditer(raw):
+        key = m.group(1)
+        if key in out: # ключ повторяется - пусть решает json.loads
+            return None
+        v = _VALUE_RE.match(raw, m.end())
+        if v is None:
+            return None
+        string, number, frac, exp, literal = v.groups()
+        if string is not None:
+            out[key] = string
+        elif number is not None:
+            out[key] = float(number) if frac or exp else int(number)
+        else:
+            out[key] = _LITERALS[literal]
+    return out
+
+class LazyJson:
+    __slots__ = ("raw", "_data", "_error")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._data = None
+        self._error = None
+
+    def __bool__(self):
+        return bool(self.raw)
+
+    def __repr__(self):
+        return f"LazyJson({self.raw!r})"
+
+    # полный разбор (один раз, результат или ошибка кешируются)
+    def load(self):
+        if self._error is not None:
+            raise self._error
+        if self._data is None:
+            try:
+                self._data = json.loads(self.raw)
+            except json.JSONDecodeError as e:
+                self._error = e
+                raise
+        return self._data
+
+    # значения ключей верхнего уровня: dict только найденных ключей. бросает JSONDecodeError, если payload не JSON
+    def get_many(self, keys):
+        data = self._data
+        if data is None:
+            if self._error is None and len(self.raw) >= EXTRACT_MIN_LEN:
+                fields = extract_fields(self.raw, keys)
+                if fields is not None:
+                    return fields
+            data = self.load()
+        if not isinstance(data, dict):
+            return {}
+        return {k: data[k] for k in keys if k in data}
+
+    def get(self, key, default=None):
+        return self.get_many((key,)).get(key, default)
+
+# конвертеры для RecordReader: info/response превращаются в LazyJson один раз при чтении строки
+PAYLOAD_CONVERTERS = {"info": LazyJson, "response": LazyJson}
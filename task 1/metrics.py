@@ -0,0 +1,103 @@
+import atexit
+import cProfile
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+METRICS_ENV = "PIPELINE_METRICS_FILE" # куда шаг пишет свои метрики (задаёт pipeline.py)
+TRACEMALLOC_ENV = "PIPELINE_TRACEMALLOC" # "1" - шаг меряет пик памяти Python-объектов через tracemalloc
+PROFILE_ENV = "PIPELINE_PROFILE" # путь для дампа cProfile шага
+
+# общий модуль: task 1/metrics.py и task 2/metrics.py должны совпадать побайтно (задачи - отдельные папки скриптов без общего пакета),
+# правки вносить в обе копии; tests/test_shared_modules.py в task 1 это проверяет
+# метрики шагов pipeline.py. сам шаг сообщает счётчики строк через report(); при выходе процесса (atexit)
+# они пишутся в JSON-файл из METRICS_ENV вместе с байтами ввода-вывода (/proc/self/io, только Linux) и пиком tracemalloc.
+# профилировщик тоже включается здесь, при импорте metrics шагом, а не через python -m cProfile - так код выхода
+# шага (sys.exit в валидаторах) не теряется.
+# время, CPU и peak RSS pipeline.py снимает снаружи через os.wait4. без METRICS_ENV report() ничего не пишет.
+# процессы пула (--workers) выходят через os._exit, поэтому их ввод-вывод в метрики шага не попадает - только
+# в CPU/RSS из wait4 (CPU дочерних процессов, которых шаг дождался, входит в его rusage)
+
+_counters = {}
+
+# счётчики шага: rows_read, rows_kept, rows_written и т.п. (повторный вызов перезаписывает значения)
+def report(**counters):
+    _counters.update(counters)
+
+def _io_bytes():
+    try:
+        with open("/proc/self/io", "r") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return {}
+    return {"read_bytes": int(fields["rchar"]), "write_bytes": int(fields["wchar"])}
+
+def _write_metrics(path):
+    data = dict(_counters)
+    data.update(_io_bytes())
+    if tracemalloc.is_tracing():
+        data["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+def _dump_profile(profiler, path):
+    profiler.disable()
+    profiler.dump_stats(path)
+
+_path = os.environ.get(METRICS_ENV)
+if _path:
+    if os.environ.get(TRACEMALLOC_ENV) == "1":
+        tracemalloc.start()
+    atexit.register(_write_metrics, _path)
+if os.environ.get(PROFILE_ENV):
+    _profiler = cProfile.Profile()
+    atexit.register(_dump_profile, _profiler, os.environ[PROFILE_ENV])
+    _profiler.enable()
+
+# запускает шаг и собирает его метрики: wall/CPU время и peak RSS (os.wait4, где есть) плюс то, что шаг записал сам.
+# profile_path - запустить шаг под cProfile и сохранить статистику туда. возвращает (код выхода, метрики)
+def run_step(script, args=(), cwd=None, profile_path=None, trace_memory=False):
+    fd, metrics_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    env = dict(os.environ, **{METRICS_ENV: metrics_path, TRACEMALLOC_ENV: "1" if trace_memory else "0"})
+    env.pop(PROFILE_ENV, None)
+    if profile_path:
+        env[PROFILE_ENV] = str(profile_path)
+    cmd = [sys.executable, str(script), *args]
+    try:
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env)
+        step = {}
+        if hasattr(os, "wait4"):
+            _pid, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            step.update({
+                "cpu_user_s": round(usage.ru_utime, 4),
+                "cpu_sys_s": round(usage.ru_stime, 4),
+                "peak_rss_mb": round(usage.ru_maxrss / 1024, 1), # ru_maxrss на Linux - в КБ
+            })
+        else:
+            proc.wait()
+        step["wall_s"] = round(time.perf_counter() - start, 4)
+        if os.path.getsize(metrics_path):
+            with open(metrics_path, "r", encoding="utf-8") as f:
+                step.update(json.load(f))
+    finally:
+        os.remove(metrics_path)
+    return proc.returncode, step
+
+# итоговый JSON-отчёт прогона
+def write_report(path, steps, started):
+    report_data = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "wall_s": round(time.time() - started, 4),
+        "steps": steps,
+    }
+    tmp_path = str(path) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report_data, f, indent=2)
+    os.replace(tmp_path, path)
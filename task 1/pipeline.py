@@ -1,7 +1,14 @@
-import subprocess
+import argparse
+import os
 import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
+import metrics
+import step_cache
+from textio import COMPRESSORS, output_path
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 STEPS = [
     "filter_funding_rows.py",
@@ -9,18 +16,174 @@ STEPS = [
     "filter_om_funding.py",
     "calculate_om_funding_totals.py",
 ]
+# граф шагов: входы и выходы (файлы рядом со скриптами), after - шаги, которых надо дождаться, хотя их выходы не нужны,
+# cache=False - шаг всегда запускается (итоги печатаются в консоль, выходного файла нет).
+# gate - шаг идёт параллельно с проверкой gate, но пишет свой (единственный) выход во временный файл (--output,
+# pending_output); файл переименовывается на место, только когда gate прошёл, и удаляется, если gate упал. так
+# funding_transfers_OM.csv не появляется по непроверенным данным, а фильтр OM не ждёт конца validate_data.
+# шаг стартует, когда готовы все шаги, пишущие его входы, и шаги из after; до --jobs шагов одновременно
+STEP_GRAPH = {
+    "filter_funding_rows.py": {"inputs": ["BSGDATA_public_data_transfers.csv"], "outputs": ["funding_transfers.csv"]},
+    "validate_data.py": {"inputs": ["funding_transfers.csv"], "outputs": []},
+    "filter_om_funding.py": {"inputs": ["funding_transfers.csv", "BSGDATA_public_statichange_instruments_v2.csv"], "outputs": ["funding_transfers_OM.csv"], "gate": "validate_data.py"},
+    "calculate_om_funding_totals.py": {"inputs": ["funding_transfers_OM.csv", "accounts to exchanges.csv"], "outputs": [], "after": ["validate_data.py"], "cache": False},
+}
 
-def main():
-    for name in STEPS:
+# флаги, которые есть только у пошагового запуска: --stream считает всё в одном процессе без них
+STEP_RUN_FLAGS = ["--workers", "--fail-fast", "--incremental", "--metrics", "--tracemalloc", "--profile", "--compress", "--jobs", "--force", "--hash-inputs"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Funding pipeline: filter -> validate -> filter OM -> totals")
+    parser.add_argument("--stream", action="store_true", help="run all steps in-process over a single read of the transfers CSV")
+    parser.add_argument("--write-intermediate", action="store_true", help="with --stream: also write funding_transfers.csv and funding_transfers_OM.csv")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes for filter_funding_rows.py and a full (not capped at 50 issues) validate_data.py")
+    parser.add_argument("--fail-fast", action="store_true", help="with --workers: validate_data.py stops at the first issue")
+    parser.add_argument("--incremental", action="store_true", help="calculate_om_funding_totals.py: only aggregate rows appended since the last checkpoint")
+    parser.add_argument("--metrics", help="write a JSON report with per-step time, CPU, rows, I/O bytes and peak memory to this path")
+    parser.add_argument("--tracemalloc", action="store_true", help="also record the tracemalloc peak of every step (slower)")
+    parser.add_argument("--profile", choices=STEPS, help="run this step under cProfile, stats go to <step>.prof")
+    parser.add_argument("--compress", choices=("gz", "bz2", "xz"), help="write funding_transfers.csv and funding_transfers_OM.csv compressed")
+    parser.add_argument("--jobs", type=int, default=2, help="how many independent steps may run at the same time")
+    parser.add_argument("--force", action="store_true", help="ignore the step cache and rerun every step")
+    parser.add_argument("--hash-inputs", action="store_true", help="fingerprint step inputs by content (sha1) instead of size+mtime")
+    args = parser.parse_args()
+    if args.stream:
+        dests = {flag: flag[2:].replace("-", "_") for flag in STEP_RUN_FLAGS}
+        unsupported = [flag for flag, dest in dests.items() if getattr(args, dest) != parser.get_default(dest)]
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} cannot be combined with --stream")
+    if args.write_intermediate and not args.stream:
+        parser.error("--write-intermediate needs --stream")
+    return args
+
+# дополнительные аргументы командной строки для шага
+def step_args(name, args):
+    compress = ["--compress", args.compress] if args.compress else []
+    if name == "filter_funding_rows.py":
+        return (["--workers", str(args.workers)] if args.workers > 0 else []) + compress
+    if name == "filter_om_funding.py":
+        return compress + ["--output", pending_output(name)]
+    if name == "validate_data.py" and args.workers > 0:
+        return ["--workers", str(args.workers)] + (["--fail-fast"] if args.fail_fast else [])
+    if name == "calculate_om_funding_totals.py" and args.incremental:
+        return ["--incremental"]
+    return []
+
+# временный файл выхода шага с gate: funding_transfers_OM.csv -> funding_transfers_OM.pending.csv
+def pending_output(name):
+    output = Path(STEP_GRAPH[name]["outputs"][0])
+    return output.stem + ".pending" + output.suffix
+
+# переносит временный выход шага на место (старые варианты выхода с другим сжатием удаляются, как в textio.open_output)
+def promote_output(name, compress):
+    output = STEP_GRAPH[name]["outputs"][0]
+    target = output_path(output, compress)
+    for other in [output] + [f"{output}.{ext}" for ext in COMPRESSORS]:
+        if other != target and os.path.exists(SCRIPT_DIR / other):
+            os.remove(SCRIPT_DIR / other)
+    os.replace(SCRIPT_DIR / output_path(pending_output(name), compress), SCRIPT_DIR / target)
+
+def discard_output(name):
+    pending = pending_output(name)
+    for path in [pending] + [f"{pending}.{ext}" for ext in COMPRESSORS]:
+        if os.path.exists(SCRIPT_DIR / path):
+            os.remove(SCRIPT_DIR / path)
+
+# шаги, которые должны закончиться до name: пишущие его входы и перечисленные в after
+def step_deps(name):
+    spec = STEP_GRAPH[name]
+    deps = set(spec.get("after", ()))
+    for other in STEPS:
+        if other != name and set(STEP_GRAPH[other]["outputs"]) & set(spec["inputs"]):
+            deps.add(other)
+    return deps
+
+def run_graph(args):
+    cache_path = SCRIPT_DIR / step_cache.CACHE_JSON
+    cache = step_cache.load_cache(cache_path)
+    deps = {name: step_deps(name) for name in STEPS}
+    pending = list(STEPS)
+    done = set()
+    staged = {} # шаг с gate закончился, его выход ждёт gate: имя -> ключ кеша
+    running = {}
+    steps = []
+    failed = 0
+
+    def start(pool, name):
         path = SCRIPT_DIR / name
         if not path.exists():
             print(f"Missing script: {path}", file=sys.stderr)
             sys.exit(1)
+        spec = STEP_GRAPH[name]
+        extra = step_args(name, args)
+        key = step_cache.step_key(path, extra, spec["inputs"], SCRIPT_DIR, args.hash_inputs)
+        if spec.get("cache", True) and not args.force and step_cache.is_fresh(cache, name, key, spec["outputs"], SCRIPT_DIR):
+            print(f"Skipping {name} (inputs, code and arguments unchanged)")
+            steps.append({"name": name, "returncode": 0, "cached": True})
+            done.add(name)
+            return
         print(f"Running {name} ...")
-        r = subprocess.run([sys.executable, str(path)], cwd=SCRIPT_DIR)
-        if r.returncode != 0:
-            print(f"{name} failed with exit code {r.returncode}", file=sys.stderr)
-            sys.exit(r.returncode)
+        profile_path = SCRIPT_DIR / (Path(name).stem + ".prof") if args.profile == name else None
+        future = pool.submit(metrics.run_step, path, extra, cwd=SCRIPT_DIR, profile_path=profile_path, trace_memory=args.tracemalloc)
+        running[future] = (name, key)
+
+    with ThreadPoolExecutor(max(1, args.jobs)) as pool:
+        while pending or running:
+            launched = True
+            while launched and not failed: # пропущенный по кешу шаг сразу освобождает зависящие от него
+                launched = False
+                for name in list(pending):
+                    if len(running) >= max(1, args.jobs):
+                        break
+                    if deps[name] <= done:
+                        pending.remove(name)
+                        start(pool, name)
+                        launched = True
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, key = running.pop(future)
+                returncode, step = future.result()
+                steps.append(dict(name=name, returncode=returncode, **step))
+                if returncode != 0:
+                    print(f"{name} failed with exit code {returncode}", file=sys.stderr)
+                    failed = failed or returncode
+                    if "gate" in STEP_GRAPH[name]:
+                        discard_output(name)
+                    continue
+                if "gate" in STEP_GRAPH[name]:
+                    staged[name] = key
+                    continue
+                done.add(name)
+                if STEP_GRAPH[name].get("cache", True):
+                    step_cache.record(cache, name, key, STEP_GRAPH[name]["outputs"], SCRIPT_DIR)
+                    step_cache.save_cache(cache_path, cache)
+            for name in [n for n in staged if STEP_GRAPH[n]["gate"] in done]:
+                promote_output(name, args.compress)
+                done.add(name)
+                step_cache.record(cache, name, staged.pop(name), STEP_GRAPH[name]["outputs"], SCRIPT_DIR)
+                step_cache.save_cache(cache_path, cache)
+    for name in staged: # gate не прошёл - выход по непроверенным данным не нужен
+        print(f"Discarding {pending_output(name)}: {STEP_GRAPH[name]['gate']} did not pass", file=sys.stderr)
+        discard_output(name)
+    return failed, steps
+
+def main():
+    args = parse_args()
+    if args.stream:
+        import stream_pipeline
+        print("Running stream_pipeline ...")
+        stream_pipeline.run(write_intermediate=args.write_intermediate)
+        print("Done.")
+        return
+    started = time.time()
+    failed, steps = run_graph(args)
+    if args.metrics:
+        metrics.write_report(args.metrics, steps, started)
+        print(f"Metrics written to {args.metrics}")
+    if failed:
+        sys.exit(failed)
     print("Done.")
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+import ast
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from textio import resolve_input
+
+CACHE_JSON = ".pipeline_cache.json"
+HASH_BLOCK = 1 << 20
+
+# кеш шагов pipeline.py. ключ шага - sha1 от версии кода (содержимое скрипта и всех локальных модулей, которые он
+# импортирует, рекурсивно), аргументов шага и отпечатков входных файлов (размер+mtime или sha1 содержимого).
+# шаг пропускается, если ключ совпал с последним успешным запуском и его выходные файлы на месте и не менялись с тех пор
+
+def _sha1_file(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# отпечаток файла (или его сжатого варианта, см. textio.resolve_input): None - файла нет
+def file_stamp(path, content_hash=False):
+    path = resolve_input(path)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if content_hash:
+        return {"name": os.path.basename(path), "size": st.st_size, "sha1": _sha1_file(path)}
+    return {"name": os.path.basename(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+# скрипт и все модули из script_dir, которые он импортирует (прямо или через другие локальные модули)
+def local_modules(script, script_dir):
+    seen = set()
+    todo = [Path(script)]
+    while todo:
+        path = todo.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        tree = ast.parse(path.read_bytes(), filename=str(path))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                candidate = Path(script_dir) / (name.split(".")[0] + ".py")
+                if candidate.exists():
+                    todo.append(candidate)
+    return sorted(seen)
+
+def step_key(script, args, inputs, script_dir, content_hash=False):
+    code = {p.name: _sha1_file(p) for p in local_modules(script, script_dir)}
+    stamps = {str(p): file_stamp(Path(script_dir) / p, content_hash) for p in inputs}
+    blob = json.dumps({"code": code, "args": list(args), "inputs": stamps}, sort_keys=True)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+def load_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_cache(path, cache):
+    tmp_path = str(path) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, path)
+
+# True, если шаг можно не запускать
+def is_fresh(cache, name, key, outputs, script_dir):
+    entry = cache.get(name)
+    if entry is None or entry["key"] != key:
+        return False
+    for p in outputs:
+        stamp = file_stamp(Path(script_dir) / p)
+        if stamp is None or stamp != entry["outputs"].get(str(p)):
+            return False
+    return True
+
+def record(cache, name, key, outputs, script_dir):
+    cache[name] = {"key": key, "outputs": {str(p): file_stamp(Path(script_dir) / p) for p in outputs}}
@@ -0,0 +1,118 @@
+import csv
+import os
+import sys
+
+from calculate_om_funding_totals import ACCOUNTS_CSV, FUNDING_CONVERTERS, add_row, load_account_to_exchange, new_totals, print_totals
+from filter_funding_rows import INPUT_CSV, OUTPUT_CSV as FUNDING_CSV, should_keep_row
+from filter_om_funding import INSTRUMENTS_CSV, OUTPUT_CSV as FUNDING_OM_CSV, load_om_perp_symbols, row_has_om
+from json_fields import PAYLOAD_CONVERTERS
+from records import RecordReader
+from textio import open_output, open_text, output_path
+from validate_data import MAX_ISSUES, REQUIRED_COLUMNS, check_header, check_row
+
+# потоковый режим: все четыре шага пайплайна как генераторы поверх одного чтения data_transfers CSV.
+# промежуточные funding_transfers.csv / funding_transfers_OM.csv пишутся только если попросили (write_intermediate=True).
+# по стадиям идут пары (исходная строка, кортеж колонок REQUIRED_COLUMNS). info/response в кортеже - LazyJson,
+# так что response, разобранный при проверке, переиспользуется фильтром OM и подсчётом итогов
+
+to_account_id = FUNDING_CONVERTERS["account_id"]
+to_amount = FUNDING_CONVERTERS["amount"]
+to_side = FUNDING_CONVERTERS["side"]
+
+class ValidationFailed(Exception):
+    pass
+
+# шаг filter_funding_rows: пропускает дальше только строки по фандингу
+def funding_rows(rows):
+    for raw, record in rows:
+        if should_keep_row(record[1], record[2]):
+            yield raw, record
+
+# шаг validate_data: проверяет строки на лету. номер строки считается так, как если бы это был funding_transfers.csv.
+# строки с ошибками дальше не идут (следующие шаги на них падали бы), проход продолжается, чтобы собрать отчёт;
+# как и validate_data.py, останавливаемся после MAX_ISSUES ошибок
+def validated_rows(rows, errors):
+    for i, (raw, record) in enumerate(rows, start=2):
+        row_errors = check_row(i, record)
+        if row_errors:
+            errors.extend(row_errors)
+            if len(errors) >= MAX_ISSUES:
+                errors.append(f"... (stopping after {MAX_ISSUES} issues)")
+                raise ValidationFailed()
+            continue
+        yield raw, record
+
+# шаг filter_om_funding: оставляет только строки по OM perpetual
+def om_rows(rows, om_perp_symbols):
+    for raw, record in rows:
+        if row_has_om(record[5], record[6], om_perp_symbols):
+            yield raw, record
+
+# пишет проходящие строки в CSV и отдаёт их дальше без изменений
+def tee_to_csv(rows, fout, fieldnames):
+    writer = csv.writer(fout)
+    writer.writerow(fieldnames)
+    for raw, record in rows:
+        writer.writerow(raw)
+        yield raw, record
+
+# один проход по INPUT_CSV: фильтр фандинга -> проверка -> фильтр OM -> итоги по биржам.
+# если проверка не прошла, funding_transfers.csv дописывается до конца и остаётся (как после отдельного
+# filter_funding_rows.py - его можно посмотреть), а funding_transfers_OM.csv удаляется. если проход упал,
+# удаляются оба промежуточных файла - они были бы неполными
+def run(write_intermediate=False):
+    account_to_exchange = load_account_to_exchange(ACCOUNTS_CSV)
+    om_perp_symbols = load_om_perp_symbols()
+    print(f"Loaded {len(om_perp_symbols)} OM perpetual symbol forms from {INSTRUMENTS_CSV}")
+
+    by_exchange = new_totals()
+    errors = []
+    outputs = [] # (путь, файл) промежуточных CSV
+    complete = set() # пути, которые дописаны до конца и остаются
+    try:
+        with open_text(INPUT_CSV) as fin:
+            reader = RecordReader(fin, REQUIRED_COLUMNS, converters=PAYLOAD_CONVERTERS)
+            fieldnames = reader.fieldnames
+            if fieldnames is None:
+                raise ValueError("CSV has no header")
+            errors.extend(check_header(fieldnames))
+            if errors:
+                raise ValidationFailed()
+
+            rows = funding_rows(reader.pairs())
+            funding_tee = None
+            if write_intermediate:
+                outputs.append((FUNDING_CSV, open_output(FUNDING_CSV)))
+                rows = funding_tee = tee_to_csv(rows, outputs[-1][1], fieldnames)
+            rows = om_rows(validated_rows(rows, errors), om_perp_symbols)
+            if write_intermediate:
+                outputs.append((FUNDING_OM_CSV, open_output(FUNDING_OM_CSV)))
+                rows = tee_to_csv(rows, outputs[-1][1], fieldnames)
+
+            try:
+                for _raw, (account_id, _type_exch, _type_id, side, amount, _info, response) in rows:
+                    add_row(by_exchange, account_to_exchange, (to_account_id(account_id), to_amount(amount), to_side(side), response))
+            except ValidationFailed:
+                if funding_tee is not None: # проверка остановилась на MAX_ISSUES - дописываем строки фандинга
+                    for _ in funding_tee:
+                        pass
+            complete.add(FUNDING_CSV)
+            if not errors:
+                complete.add(FUNDING_OM_CSV)
+    except ValidationFailed:
+        pass
+    finally:
+        for path, fout in outputs:
+            fout.close()
+            if path not in complete and os.path.exists(output_path(path)):
+                os.remove(output_path(path))
+
+    if errors:
+        print("Validation failed. Issues:", file=sys.stderr)
+        for e in errors:
+            print(f"  - {e}", file=sys.stderr)
+        sys.exit(1)
+    print_totals(by_exchange)
+
+if __name__ == "__main__":
+    run(write_intermediate="--write-intermediate" in sys.argv[1:])
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# скрипты задачи импортируют друг друга как соседние модули (запуск из папки задачи) - для тестов так же
+TASK_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(TASK_DIR))
@@ -0,0 +1,50 @@
+import csv
+import io
+
+import pytest
+
+import csv_chunks
+from csv_chunks import CompleteRecords, read_range_text, split_ranges
+
+# JSON в кавычках с переносами строк и "" внутри поля: граница записи - только \n при чётном числе кавычек
+
+def write_transfers(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "info", "response"])
+        for i in range(rows):
+            info = '{\n "symbol": "OMUSDT",\n "note": "a ""quoted""\nline"\n}' if i % 3 == 0 else "OMUSDT"
+            w.writerow([i, info, f'{{"pnl": "{i}", "текст": "ü"}}'])
+
+def read_all(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1000, 1 << 20])
+def test_ranges_cover_whole_records(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(csv_chunks, "BLOCK_SIZE", 16) # чётность кавычек переносится между блоками
+    path = tmp_path / "transfers.csv"
+    write_transfers(path, 50)
+    header_end, ranges = split_ranges(path, chunk_size)
+    expected = read_all(path)
+    assert ranges[0][0] == header_end and ranges[-1][1] == path.stat().st_size
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    rows = [expected[0]]
+    for start, end in ranges:
+        rows.extend(csv.reader(read_range_text(path, start, end)))
+    assert rows == expected
+    if chunk_size < 64:
+        assert len(ranges) > 1
+
+def test_complete_records_stop_at_unfinished_record(tmp_path):
+    path = tmp_path / "transfers.csv"
+    write_transfers(path, 4)
+    complete = path.read_bytes()
+    with open(path, "ab") as f:
+        f.write(b'4,"{\n ""symbol"": ""OM') # запись дописывается - кавычка ещё не закрыта
+    with open(path, "rb") as f:
+        records = CompleteRecords(f, 0)
+        rows = list(csv.reader(records))
+        assert rows == list(csv.reader(io.StringIO(complete.decode("utf-8"), newline="")))
+        assert records.end == len(complete)
+        assert records.last_record.startswith(b"3,")
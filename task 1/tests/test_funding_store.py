@@ -0,0 +1,74 @@
+import csv
+import json
+import os
+
+import pytest
+
+import funding_store
+from filter_om_funding import INSTRUMENTS_CSV
+from funding_store import ACCOUNTS_CSV, INPUT_CSV, STORE_DIR, load_store, ts_to_minutes
+
+HEADER = ["id", "account_id", "type_exch", "type_id", "side", "amount", "info", "response", "ts"]
+ROWS = [
+    [1, 1, "FUNDING", "405", -1, "2", json.dumps({"symbol": "OM-USDT-SWAP"}, indent=1), "{}", "2023-01-01T10:00"],
+    [2, 2, "FUNDING", "405", 1, "1", "OMUSDT", json.dumps({"pnl": "0.5"}), "2023-01-02T00:00+03:00"],
+    [3, 2, "FUNDING", "405", 1, "3", "BTCUSDT", "{}", "2023-01-02T12:00"],
+    [4, 3, "FUNDING", "405", "", "", "XRPUSDT", "{}", ""],
+]
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for path, rows in ((ACCOUNTS_CSV, [["id", "exchange"], [1, "Okex"], [2, "Binance"]]),
+                       (INSTRUMENTS_CSV, [["instrument_exch", "instrument_bender", "asset_base", "contract_type", "exchange"],
+                                          ["OM-USDT-SWAP", "OM-USDT-SWAP", "OM", "perpetual", "Okex"],
+                                          ["OMUSDT", "OM-USDT-SWAP", "OM", "perpetual", "Binance"],
+                                          ["BTCUSDT", "BTC-USDT-SWAP", "BTC", "perpetual", "Binance"]]),
+                       (INPUT_CSV, [HEADER] + ROWS)):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(rows)
+    return tmp_path
+
+def counted_builds(monkeypatch):
+    calls = []
+    build_store = funding_store.build_store
+    def counted(*args):
+        calls.append(args)
+        return build_store(*args)
+    monkeypatch.setattr(funding_store, "build_store", counted)
+    return calls
+
+def test_select_and_totals(workdir):
+    store = load_store()
+    assert store.rows == 4 and store.has_ts
+    assert list(store.select(asset="om")) == [0, 1]
+    assert list(store.select(exchange="Binance")) == [1, 2]
+    assert list(store.select(account=2, asset="BTC")) == [2]
+    assert list(store.select(asset="ETH")) == []
+    assert store.totals(store.select(asset="OM")) == {"paid": 2.0, "received": 0.5, "count_paid": 1, "count_received": 1, "skipped": 0}
+    by_exchange = store.totals(range(store.rows), "exchange")
+    assert by_exchange[""]["skipped"] == 1 # аккаунта 3 нет в accounts, суммы нет
+    assert by_exchange["Binance"]["received"] == 3.5
+    assert [r["instrument"] for r in store.records(store.select(exchange="Okex"))] == ["OM_USDT_SWAP"]
+
+def test_time_filters(workdir):
+    store = load_store()
+    # строка 2 - 2023-01-01T21:00 UTC, строка без ts в фильтр по времени не попадает
+    assert list(store.select(since=ts_to_minutes("2023-01-01T20:00"))) == [1, 2]
+    assert list(store.select(since=ts_to_minutes("2023-01-01T23:00+02:00"), until=ts_to_minutes("2023-01-02T12:00"))) == [1]
+    assert [r["ts"] for r in store.records([1, 3])] == ["2023-01-01T21:00:00", ""]
+
+def test_store_is_reused_until_inputs_change(workdir, monkeypatch):
+    builds = counted_builds(monkeypatch)
+    first = load_store()
+    again = load_store()
+    assert len(builds) == 1
+    assert again.amount.tobytes() == first.amount.tobytes() and again.assets == first.assets
+    with open(INPUT_CSV, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow([5, 1, "FUNDING", "405", 1, "4", "OM-USDT-SWAP", "{}", "2023-01-03T00:00"])
+    assert load_store().rows == 5 and len(builds) == 2
+    assert os.path.exists(os.path.join(STORE_DIR, "meta.json"))
+
+@pytest.mark.parametrize("value", ["2023-01-02T00:00", "2023-01-02T00:00+00:00", "2023-01-02T03:00+03:00", "2023-01-01T19:00-05:00"])
+def test_ts_to_minutes_is_utc(value):
+    assert ts_to_minutes(value) == ts_to_minutes("2023-01-02T00:00") == 27876960
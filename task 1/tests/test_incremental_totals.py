@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+
+import pytest
+
+import calculate_om_funding_totals as totals
+from calculate_om_funding_totals import ACCOUNTS_CSV, FUNDING_CSV, STATE_JSON, main_incremental
+
+HEADER = ["id", "account_id", "type_exch", "type_id", "side", "amount", "info", "response"]
+
+def row(i, pnl=None, side=1, amount="1.5"):
+    response = json.dumps({"symbol": "OMUSDT", "pnl": pnl}, indent=1) if pnl is not None else "{}" # indent - перенос внутри кавычек
+    return [i, i % 2 + 1, "FUNDING", "405", side, amount, "OMUSDT", response]
+
+def csv_bytes(rows):
+    out = io.StringIO(newline="")
+    csv.writer(out).writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+def state():
+    with open(STATE_JSON, encoding="utf-8") as f:
+        return json.load(f)
+
+# итоги с нуля тем же кодом - с чем сравниваются итоги, накопленные по чекпоинтам
+def full_totals(tmp_path):
+    main_incremental(str(tmp_path / "full_state.json"))
+    with open(tmp_path / "full_state.json", encoding="utf-8") as f:
+        return json.load(f)["totals"]
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open(ACCOUNTS_CSV, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows([["id", "exchange"], [1, "Okex"], [2, "Binance"]])
+    with open(FUNDING_CSV, "wb") as f:
+        f.write(csv_bytes([HEADER, row(1, "-2"), row(2, side=-1), row(3, "0.25")]))
+    return tmp_path
+
+def test_appended_rows_are_added_to_checkpoint(workdir, capsys):
+    main_incremental()
+    assert "Full rebuild" in capsys.readouterr().out
+    with open(FUNDING_CSV, "ab") as f:
+        f.write(csv_bytes([row(4, "3"), row(5, side="", amount="")]))
+        f.write(b'6,1,FUNDING,405,1,1,OMUSDT,"{\n ""pnl') # недописанная запись - остаётся на следующий запуск
+    main_incremental()
+    out = capsys.readouterr().out
+    assert "Resuming" in out and "Processed 2 new rows" in out and "trailing bytes" in out
+    assert state()["totals"] == {
+        "Binance": {"paid": 2.0, "received": 0.25, "count_paid": 1, "count_received": 1, "skipped": 1},
+        "Okex": {"paid": 1.5, "received": 3.0, "count_paid": 1, "count_received": 1, "skipped": 0},
+    }
+
+    with open(FUNDING_CSV, "ab") as f:
+        f.write(b'"": ""7""\n}"\n')
+    main_incremental()
+    assert "Processed 1 new rows" in capsys.readouterr().out
+    assert state()["totals"] == full_totals(workdir)
+
+@pytest.mark.parametrize("change", ["rewrite", "truncate", "accounts"])
+def test_changed_source_is_rebuilt(workdir, capsys, change):
+    main_incremental()
+    if change == "rewrite":
+        with open(FUNDING_CSV, "wb") as f:
+            f.write(csv_bytes([HEADER, row(1, "-2"), row(2, side=-1), row(3, "9.75")]))
+    elif change == "truncate":
+        with open(FUNDING_CSV, "wb") as f:
+            f.write(csv_bytes([HEADER, row(1, "-2")]))
+    else:
+        with open(ACCOUNTS_CSV, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows([["id", "exchange"], [1, "Bybit"], [2, "Binance"]])
+    capsys.readouterr()
+    main_incremental()
+    assert "Full rebuild" in capsys.readouterr().out
+    assert state()["totals"] == full_totals(workdir)
+
+def test_state_is_reset_with_totals_version(workdir, capsys, monkeypatch):
+    main_incremental()
+    monkeypatch.setattr(totals, "TOTALS_VERSION", totals.TOTALS_VERSION + 1)
+    capsys.readouterr()
+    main_incremental()
+    assert "Full rebuild" in capsys.readouterr().out
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from json_fields import EXTRACT_MIN_LEN, LazyJson, extract_fields
+
+PNL_KEYS = ("pnl", "balChg", "realized_pnl")
+
+def expected(raw, keys):
+    data = json.loads(raw)
+    return {k: data[k] for k in keys if k in data}
+
+def test_flat_object():
+    raw = '{"symbol": "OMUSDT", "pnl": "-1.5", "balChg": 2, "realized_pnl": 1.5e-3, "ok": true}'
+    assert extract_fields(raw, PNL_KEYS) == expected(raw, PNL_KEYS)
+    assert extract_fields(raw, ("ok", "missing")) == {"ok": True}
+
+def test_key_text_inside_value_is_not_a_key():
+    raw = '{"note": "pnl", "symbol": "balChg", "pnl": 3}'
+    assert extract_fields(raw, PNL_KEYS) == {"pnl": 3}
+
+@pytest.mark.parametrize("raw", [
+    '{"symbol": "OM", "meta": {"pnl": 0}}', # вложенный объект
+    '{"data": [{"pnl": 1}], "pnl": 2}', # массив
+    '{"pnl": "a\\"b"}', # экранирование
+    '{"pnl": 1, "pnl": 2}', # ключ повторяется
+    '[1, 2]',
+])
+def test_ambiguous_payloads_fall_back(raw):
+    assert extract_fields(raw, PNL_KEYS) is None
+
+# вложенные повторяющиеся ключи: прежний подсчёт глубины был квадратичным (секунды на n=5000),
+# теперь такой payload сразу уходит в json.loads
+def test_nested_repeated_keys():
+    raw = json.dumps({"data": [{"pnl": i, "symbol": "OMUSDT"} for i in range(5000)], "pnl": 1})
+    assert extract_fields(raw, PNL_KEYS) is None
+    payload = LazyJson(raw)
+    assert payload.get_many(PNL_KEYS) == {"pnl": 1}
+    assert payload.load()["data"][4999] == {"pnl": 4999, "symbol": "OMUSDT"}
+
+def test_get_many_matches_json_loads():
+    short = json.dumps({"symbol": "OMUSDT", "pnl": "0.1"})
+    long = json.dumps({"symbol": "OMUSDT", "pnl": "0.1", **{f"field_{i}": i for i in range(EXTRACT_MIN_LEN // 10)}})
+    assert len(long) >= EXTRACT_MIN_LEN
+    for raw in (short, long, '{"meta": {"pnl": 0}, "balChg": -2}', "[1]"):
+        assert LazyJson(raw).get_many(PNL_KEYS) == (expected(raw, PNL_KEYS) if raw.startswith("{") else {})
+        assert LazyJson(raw).get("pnl", "none") == (expected(raw, ("pnl",)).get("pnl", "none") if raw.startswith("{") else "none")
+
+def test_invalid_json_error_is_cached():
+    payload = LazyJson('{"pnl": ')
+    for _ in range(2):
+        with pytest.raises(json.JSONDecodeError):
+            payload.get_many(PNL_KEYS)
+    assert not LazyJson("")
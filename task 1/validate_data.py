@@ -1,80 +1,160 @@
-import csv
+import argparse
 import json
 import sys
+from multiprocessing import Pool
+
+import metrics
+from csv_chunks import CHUNK_SIZE, read_range_text, split_ranges
+from json_fields import PAYLOAD_CONVERTERS
+from records import RecordReader
+from textio import is_compressed, open_text
 
 INPUT_CSV = "funding_transfers.csv"
 
 REQUIRED_COLUMNS = ("account_id", "type_exch", "type_id", "side", "amount", "info", "response")
 EXPECTED_TYPE_ID = "405"
+MAX_ISSUES = 50
+SAMPLE_CHARS = 200 # сколько символов response класть в пример ошибки
+SAMPLES_PER_TYPE = 20 # в полном режиме: сколько примеров каждого типа ошибки попадает в отчёт (считаются все)
+
+# проверяет одну строку funding_transfers.csv, возвращает список ошибок (тип ошибки, значение, текст).
+# record - кортеж колонок в порядке REQUIRED_COLUMNS, уже без пробелов по краям, info/response - LazyJson
+def find_issues(record):
+    _account_id, type_exch, type_id, side_raw, amount_raw, _info, response = record
+    issues = []
+    is_funding_by_exch = type_exch and type_exch.upper() == "FUNDING"
+    is_funding_by_id = type_id == EXPECTED_TYPE_ID
+    if not is_funding_by_exch and not is_funding_by_id:
+        issues.append(("not_funding", f"{type_exch}/{type_id}", f"row must be funding (type_exch=FUNDING or type_id=405), got type_exch={type_exch!r}, type_id={type_id!r}"))
+
+    if side_raw:
+        try:
+            side = int(side_raw)
+            if side not in (-1, 1):
+                issues.append(("side_out_of_range", side_raw, f"side must be -1 or 1, got {side}"))
+        except ValueError:
+            issues.append(("side_not_int", side_raw, f"side must be int -1 or 1, got {side_raw!r}"))
+
+    if amount_raw:
+        try:
+            float(amount_raw)
+        except ValueError:
+            issues.append(("amount_not_float", amount_raw, f"amount must be float-parsable, got {amount_raw!r}"))
+
+    if response and response.raw.startswith("{"):
+        try:
+            data = response.load() # полный разбор кешируется в LazyJson, следующие шаги его переиспользуют
+            if not isinstance(data, dict):
+                issues.append(("response_not_dict", response.raw[:SAMPLE_CHARS], "response JSON root must be dict"))
+        except json.JSONDecodeError as e:
+            issues.append(("response_invalid_json", response.raw[:SAMPLE_CHARS], f"response is not valid JSON: {e}"))
+
+    return issues
+
+# то же в виде строк "Row i: ..." (i - номер строки в файле)
+def check_row(i, record):
+    return [f"Row {i}: {message}" for _type, _value, message in find_issues(record)]
+
+# проверяет заголовок, возвращает список ошибок (пустой, если все нужные колонки на месте)
+def check_header(fieldnames):
+    if not fieldnames:
+        return ["CSV has no header"]
+    missing = [c for c in REQUIRED_COLUMNS if c not in fieldnames]
+    if missing:
+        return [f"Missing columns: {missing}"]
+    return []
 
 def run_checks():
-    errors = []
-    with open(INPUT_CSV, "r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames or []
-        if not fieldnames:
-            errors.append("CSV has no header")
-            return errors
-        missing = [c for c in REQUIRED_COLUMNS if c not in fieldnames]
-        if missing:
-            errors.append(f"Missing columns: {missing}")
+    with open_text(INPUT_CSV) as f:
+        reader = RecordReader(f, REQUIRED_COLUMNS, converters=PAYLOAD_CONVERTERS)
+        errors = check_header(reader.fieldnames)
+        if errors:
             return errors
 
-        for i, row in enumerate(reader, start=2):
-            if not isinstance(row, dict):
-                errors.append(f"Row {i}: row is not a dict")
-                continue
-
-            type_exch = (row.get("type_exch") or "").strip()
-            type_id_raw = row.get("type_id")
-            if type_id_raw is not None and not isinstance(type_id_raw, (str, int, float)):
-                errors.append(f"Row {i}: type_id must be str/int/float, got {type(type_id_raw).__name__}")
-            type_id = str(type_id_raw).strip() if type_id_raw not in (None, "") else ""
-            is_funding_by_exch = type_exch and type_exch.upper() == "FUNDING"
-            is_funding_by_id = type_id == EXPECTED_TYPE_ID
-            if not is_funding_by_exch and not is_funding_by_id:
-                errors.append(f"Row {i}: row must be funding (type_exch=FUNDING or type_id=405), got type_exch={type_exch!r}, type_id={type_id!r}")
-
-            side_raw = row.get("side")
-            if side_raw is not None and isinstance(side_raw, str) and side_raw.strip() != "":
-                try:
-                    side = int(side_raw)
-                    if side not in (-1, 1):
-                        errors.append(f"Row {i}: side must be -1 or 1, got {side}")
-                except (ValueError, TypeError):
-                    errors.append(f"Row {i}: side must be int -1 or 1, got {side_raw!r}")
-            elif side_raw is not None and not isinstance(side_raw, str):
-                errors.append(f"Row {i}: side must be str or None, got {type(side_raw).__name__}")
-
-            amount_raw = row.get("amount")
-            if amount_raw is not None and not isinstance(amount_raw, str):
-                errors.append(f"Row {i}: amount must be str, got {type(amount_raw).__name__}")
-            if amount_raw is not None and (amount_raw or "").strip():
-                try:
-                    float((amount_raw or "").strip())
-                except (ValueError, TypeError):
-                    errors.append(f"Row {i}: amount must be float-parsable, got {amount_raw!r}")
-
-            for col in ("info", "response"):
-                val = row.get(col)
-                if val is not None and not isinstance(val, str):
-                    errors.append(f"Row {i}: {col} must be str or None, got {type(val).__name__}")
-
-            response_raw = (row.get("response") or "").strip()
-            if response_raw and response_raw.startswith("{"):
-                try:
-                    data = json.loads(response_raw)
-                    if not isinstance(data, dict):
-                        errors.append(f"Row {i}: response JSON root must be dict")
-                except (json.JSONDecodeError, TypeError) as e:
-                    errors.append(f"Row {i}: response is not valid JSON: {e}")
-
-            if len(errors) >= 50:
-                errors.append("... (stopping after 50 issues)")
+        i = 1
+        for i, record in enumerate(reader, start=2):
+            errors.extend(check_row(i, record))
+            if len(errors) >= MAX_ISSUES:
+                errors.append(f"... (stopping after {MAX_ISSUES} issues)")
                 break
+        metrics.report(rows_read=i - 1, issues=len(errors))
 
     return errors
 
+# полный параллельный режим: файл режется на диапазоны по границам записей (csv_chunks.py), диапазоны проверяются
+# в пуле процессов. ошибки не обрываются на MAX_ISSUES: в отчёте количество ошибок каждого типа по всему файлу
+# и до SAMPLES_PER_TYPE примеров (тип, номер строки, значение). fail_fast - остановиться на первой ошибке
+# и прибить остальные процессы
+
+# проверяет один диапазон, возвращает (число строк, {тип: количество}, примеры с номером строки внутри диапазона)
+def check_range(task):
+    path, fieldnames, start, end, fail_fast = task
+    reader = RecordReader(read_range_text(path, start, end), REQUIRED_COLUMNS, converters=PAYLOAD_CONVERTERS, fieldnames=fieldnames)
+    return check_records(reader, fail_fast)
+
+def check_records(reader, fail_fast=False):
+    counts = {}
+    samples = []
+    rows = 0
+    for rows, record in enumerate(reader, start=1):
+        for issue_type, value, message in find_issues(record):
+            seen = counts.get(issue_type, 0)
+            counts[issue_type] = seen + 1
+            if seen < SAMPLES_PER_TYPE:
+                samples.append({"type": issue_type, "row": rows - 1, "value": value, "message": message})
+        if fail_fast and counts:
+            break
+    return rows, counts, samples
+
+def run_checks_parallel(workers, fail_fast=False, chunk_size=CHUNK_SIZE):
+    with open_text(INPUT_CSV) as f:
+        fieldnames = RecordReader(f, REQUIRED_COLUMNS).fieldnames
+    header_errors = check_header(fieldnames)
+    if header_errors:
+        return {"rows": 0, "complete": True, "counts": {"header": 1}, "issues": [{"type": "header", "row": 1, "value": "", "message": header_errors[0]}]}
+
+    result = {"rows": 0, "complete": True, "counts": {}, "issues": []}
+    counts = result["counts"]
+    if is_compressed(INPUT_CSV): # сжатый файл по смещениям не режется - весь файл одним куском в этом процессе
+        with open_text(INPUT_CSV) as f:
+            rows, counts, samples = check_records(RecordReader(f, REQUIRED_COLUMNS, converters=PAYLOAD_CONVERTERS), fail_fast)
+        for sample in samples:
+            sample["row"] += 2
+        return {"rows": rows, "complete": not (fail_fast and counts), "counts": counts, "issues": samples}
+
+    _, ranges = split_ranges(INPUT_CSV, chunk_size)
+    tasks = [(INPUT_CSV, fieldnames, start, end, fail_fast) for start, end in ranges]
+    with Pool(workers) as pool: # выход из with делает pool.terminate(), так что при fail_fast оставшиеся куски не доделываются
+        for rows, chunk_counts, samples in pool.imap(check_range, tasks):
+            for sample in samples:
+                if sum(1 for x in result["issues"] if x["type"] == sample["type"]) < SAMPLES_PER_TYPE:
+                    sample["row"] += result["rows"] + 2
+                    result["issues"].append(sample)
+            for issue_type, n in chunk_counts.items():
+                counts[issue_type] = counts.get(issue_type, 0) + n
+            result["rows"] += rows
+            if fail_fast and chunk_counts:
+                result["complete"] = False
+                break
+    return result
+
+def main_parallel(workers, fail_fast=False, report_path=None):
+    result = run_checks_parallel(workers, fail_fast)
+    metrics.report(rows_read=result["rows"], issues=sum(result["counts"].values()))
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    scope = "all rows" if result["complete"] else f"first {result['rows']} rows (fail-fast)"
+    if result["counts"]:
+        print(f"Validation failed ({scope}). Issue counts:", file=sys.stderr)
+        for issue_type, n in sorted(result["counts"].items()):
+            print(f"  {issue_type}: {n}", file=sys.stderr)
+        print("Examples:", file=sys.stderr)
+        for issue in result["issues"]:
+            print(f"  - Row {issue['row']}: {issue['message']}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{INPUT_CSV} passed validation (formatting and consistency), {result['rows']} rows checked.")
+
 def main():
     try:
         errors = run_checks()
@@ -93,4 +173,12 @@ def main():
     print(f"{INPUT_CSV} passed validation (formatting and consistency).")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=0, help="check the whole file in N processes and report counts of every issue type")
+    parser.add_argument("--fail-fast", action="store_true", help="with --workers: stop all workers at the first issue")
+    parser.add_argument("--report", help="with --workers: write the structured result as JSON to this path")
+    args = parser.parse_args()
+    if args.workers > 0:
+        main_parallel(args.workers, args.fail_fast, args.report)
+    else:
+        main()
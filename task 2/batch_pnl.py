@@ -0,0 +1,126 @@
+import argparse
+import csv
+import glob
+import os
+import sys
+from multiprocessing import Pool
+from pathlib import Path
+
+import find_PnL
+import validate_data
+from live_pnl import LIVE_OUTPUT_CSV
+from textio import COMPRESSORS, compression_of
+
+OUTPUT_DIR = "batch_output"
+SUMMARY_CSV = "pl_by_account.csv"
+SUMMARY_COLUMNS = ["account", "instrument", "realized_pl_usd", "unrealized_pl_usd", "total_pl_usd"]
+STATUS_CSV = "batch_status.csv"
+STATUS_COLUMNS = ["account", "input", "status", "issues", "instruments"]
+# выходы скриптов задачи и самого батча - при поиске входов в папке это не файлы сделок
+OUTPUT_NAMES = {find_PnL.OUTPUT_CSV, validate_data.OUTPUT_ISSUES_CSV, LIVE_OUTPUT_CSV, SUMMARY_CSV, STATUS_CSV}
+OUTPUT_SUFFIXES = (".pl.csv", ".issues.csv")
+
+# пакетный режим: проверки validate_data + find_PnL для многих файлов сделок (по файлу на аккаунт) за один запуск.
+# каждый файл читается один раз: проверки идут в том же проходе, что и мэтчинг (find_PnL.run с FillChecker,
+# как pipeline.py --inline-validation).
+# файлы раздаются процессам одного пула, так что интерпретатор и импорты поднимаются один раз на процесс,
+# а не на каждый файл, как при запуске pipeline.py по очереди. аккаунт - путь файла относительно общей папки всех входов
+# без .csv (и без .gz/.bz2/.xz): для 'fills/*.csv' это имя файла, для 'fills/*/acc.csv' - "a/acc", "b/acc".
+# для каждого файла в out_dir пишутся <аккаунт>.issues.csv и, если проверка прошла, <аккаунт>.pl.csv;
+# сводка аккаунт x инструмент - в SUMMARY_CSV, статус по файлам - в STATUS_CSV.
+# как в pipeline.py, ПнЛ не считается по файлу с проблемами в данных, если не задан ignore_issues
+
+# аккаунт по пути файла относительно общей папки входов: "acc_01.csv.gz" -> "acc_01", "a/acc.csv" -> "a/acc"
+def account_name(rel_path):
+    name = str(rel_path)
+    if compression_of(name):
+        name = os.path.splitext(name)[0]
+    name = name[:-4] if name.endswith(".csv") else name
+    return name.replace(os.sep, "/")
+
+# файлы сделок по папке или glob-маске: список (аккаунт, путь). сжатый и несжатый варианты одного файла - один вход
+# (читается тот же вариант, что выбрал бы textio.resolve_input). в папке пропускаются выходы (OUTPUT_NAMES,
+# <аккаунт>.pl.csv / .issues.csv), чтобы папку задачи или батча можно было указать как вход; glob-маска берётся как есть
+def find_inputs(pattern):
+    if os.path.isdir(pattern):
+        paths = []
+        for ext in ["csv"] + [f"csv.{c}" for c in COMPRESSORS]:
+            paths += glob.glob(os.path.join(pattern, f"*.{ext}"))
+    else:
+        paths = glob.glob(pattern)
+    plains = sorted({os.path.splitext(path)[0] if compression_of(path) else path for path in paths})
+    if os.path.isdir(pattern):
+        plains = [p for p in plains if os.path.basename(p) not in OUTPUT_NAMES and not p.endswith(OUTPUT_SUFFIXES)]
+    if not plains:
+        return []
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in plains])
+    return sorted((account_name(os.path.relpath(os.path.abspath(p), root)), p) for p in plains)
+
+# один файл в процессе пула: возвращает (аккаунт, строка статуса, строки отчёта find_PnL)
+def process_file(job):
+    account, input_path, out_dir, use_cache, ignore_issues, historical_fx = job
+    status = {"account": account, "input": input_path, "status": "ok", "issues": 0, "instruments": 0}
+    os.makedirs(os.path.dirname(os.path.join(out_dir, account)), exist_ok=True) # аккаунт из подпапки - "a/acc"
+    checker = validate_data.FillChecker()
+    try:
+        results = find_PnL.run(input_path, os.path.join(out_dir, f"{account}.pl.csv"), use_cache=use_cache, historical_fx=historical_fx,
+                               checker=checker, issues_path=os.path.join(out_dir, f"{account}.issues.csv"), ignore_issues=ignore_issues)
+    except (Exception, SystemExit) as e: # required_records выходит через SystemExit, если в файле нет нужных колонок
+        status["status"] = f"error: {e}"
+        return account, status, []
+    status["issues"] = len(checker.issues)
+    status["instruments"] = len(checker.instrument_info)
+    if results is None:
+        status["status"] = "invalid"
+        return account, status, []
+    return account, status, results
+
+# workers - размер пула (0 - всё в текущем процессе). возвращает список строк статуса по аккаунтам
+def run_batch(pattern, out_dir=OUTPUT_DIR, workers=0, use_cache=False, ignore_issues=False, historical_fx=False):
+    inputs = find_inputs(pattern)
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(account, path, out_dir, use_cache, ignore_issues, historical_fx) for account, path in inputs]
+    done = []
+    if workers > 0:
+        with Pool(workers) as pool:
+            for item in pool.imap_unordered(process_file, jobs):
+                done.append(item)
+                print(f"{item[0]}: {item[1]['status']}")
+    else:
+        for job in jobs:
+            item = process_file(job)
+            done.append(item)
+            print(f"{item[0]}: {item[1]['status']}")
+    done.sort(key=lambda item: item[0])
+
+    with open(os.path.join(out_dir, SUMMARY_CSV), "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+        w.writeheader()
+        for account, _status, results in done:
+            for row in results:
+                w.writerow(dict(row, account=account))
+    statuses = [status for _account, status, _results in done]
+    with open(os.path.join(out_dir, STATUS_CSV), "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=STATUS_COLUMNS)
+        w.writeheader()
+        w.writerows(statuses)
+    return statuses
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate and compute PnL for many fill files (one per account) in one run")
+    parser.add_argument("inputs", help="directory with <account>.csv files (.gz/.bz2/.xz too) or a glob like 'fills/*.csv'")
+    parser.add_argument("--out-dir", default=OUTPUT_DIR, help="where the per-account reports and the summary go")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (0 - run in this process)")
+    parser.add_argument("--cache", action="store_true", help="use the memory-mapped column cache of each file (see fill_cache.py)")
+    parser.add_argument("--ignore-issues", action="store_true", help="compute PnL even for files the validator flagged (from the rows without issues)")
+    parser.add_argument("--historical-fx", action="store_true", help="convert PnL at historical FX rates (see find_PnL.py --historical-fx)")
+    args = parser.parse_args()
+    statuses = run_batch(args.inputs, args.out_dir, args.workers, args.cache, args.ignore_issues, args.historical_fx)
+    failed = [s for s in statuses if s["status"] != "ok"]
+    print(f"Files: {len(statuses)}, failed or invalid: {len(failed)}")
+    print(f"Summary: {Path(args.out_dir) / SUMMARY_CSV}")
+    if not statuses:
+        print(f"No fill files match {args.inputs}", file=sys.stderr)
+    if failed or not statuses:
+        sys.exit(1)
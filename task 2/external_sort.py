@@ -0,0 +1,93 @@
+import heapq
+import pickle
+import tempfile
+from operator import itemgetter
+
+from records import RecordReader
+from textio import open_text
+
+RUN_ROWS = 200_000 # сколько сделок держим в памяти при сортировке одного куска
+MERGE_FANIN = 64 # сколько кусков сливаем за один проход (ограничивает число открытых файлов)
+BLOCK_ROWS = 4096 # куски пишутся и читаются блоками по BLOCK_ROWS строк
+
+# сортировка сделок по времени для файлов, которые не помещаются в память.
+# куски по run_rows строк сортируются в памяти и сбрасываются во временные файлы, затем сливаются heapq.merge.
+# heapq.merge при равных ключах берёт строку из более раннего куска, а sort стабильный - поэтому порядок такой же,
+# как у list.sort по всему файлу. если файл уже отсортирован по времени, сортировка не делается вовсе
+
+by_ts = itemgetter(0)
+
+def read_fills(path, columns, converters):
+    with open_text(path, encoding="utf-8-sig") as f:
+        yield from RecordReader(f, columns, converters=converters)
+
+# True, если ts в файле не убывает (отдельный проход, парсится только колонка ts)
+def is_time_ordered(path, parse_ts):
+    prev = None
+    for (ts,) in read_fills(path, ("ts",), {"ts": parse_ts}):
+        if prev is not None and ts < prev:
+            return False
+        prev = ts
+    return True
+
+def _spill(rows, tmp_dir):
+    f = tempfile.TemporaryFile(dir=tmp_dir)
+    for i in range(0, len(rows), BLOCK_ROWS):
+        pickle.dump(rows[i:i + BLOCK_ROWS], f, protocol=pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+def _read_run(f):
+    with f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+def _merge_to_file(runs, tmp_dir):
+    f = tempfile.TemporaryFile(dir=tmp_dir)
+    block = []
+    for row in heapq.merge(*(_read_run(r) for r in runs), key=by_ts):
+        block.append(row)
+        if len(block) >= BLOCK_ROWS:
+            pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+            block = []
+    if block:
+        pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+# сделки из path в порядке времени, в памяти одновременно не больше run_rows сделок (плюс по блоку на кусок при слиянии).
+# первый элемент кортежа - ts (columns[0] должна быть "ts")
+def sorted_fills(path, columns, converters, run_rows=RUN_ROWS, tmp_dir=None):
+    if is_time_ordered(path, converters["ts"]):
+        yield from read_fills(path, columns, converters)
+        return
+
+    runs = []
+    try:
+        rows = []
+        for row in read_fills(path, columns, converters):
+            rows.append(row)
+            if len(rows) >= run_rows:
+                rows.sort(key=by_ts)
+                runs.append(_spill(rows, tmp_dir))
+                rows = []
+        rows.sort(key=by_ts)
+        if not runs: # весь файл поместился в один кусок
+            yield from rows
+            return
+        if rows:
+            runs.append(_spill(rows, tmp_dir))
+        rows = None
+        while len(runs) > MERGE_FANIN: # многопроходное слияние, чтобы не держать открытыми тысячи файлов
+            groups = [runs[i:i + MERGE_FANIN] for i in range(0, len(runs), MERGE_FANIN)]
+            runs = []
+            for group in groups:
+                runs.append(_merge_to_file(group, tmp_dir))
+        yield from heapq.merge(*(_read_run(r) for r in runs), key=by_ts)
+    finally:
+        for r in runs:
+            r.close()
@@ -0,0 +1,175 @@
+import json
+import mmap
+import os
+from array import array
+from datetime import datetime, timedelta
+
+from records import RecordReader
+from textio import open_text, resolve_input
+
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".cache"
+CACHE_COLUMNS = ("instrument_exch", "cur_base", "cur_quote", "side", "amount", "price", "ts")
+EPOCH = datetime(1970, 1, 1)
+MINUTE = timedelta(minutes=1)
+
+# бинарный колоночный кеш файла сделок, общий для validate_data.py и find_PnL.py.
+# CSV разбирается один раз, колонки пишутся в отдельные файлы рядом с CSV (<имя>.csv.cache/):
+# ts - int64 минуты от 1970-01-01, side - int8, amount/price - float64, инструмент и валюты - int32 id
+# по словарям из meta.json. при чтении файлы отображаются через mmap и читаются как memoryview нужного типа
+# без копирования. кеш пересобирается, если у CSV поменялся размер или mtime.
+# кеш строится только если каждая строка нормально разбирается (ts, целый side, числа amount/price) и проходит
+# построчные проверки validate_data (side 1/-1, amount и price > 0) - иначе возвращается None и скрипты работают
+# с CSV как раньше: validate_data показывает такие строки с исходным текстом значений, которого в кеше нет.
+# неудачная сборка тоже записывается в meta.json ("cacheable": false с тем же отпечатком CSV), так что следующие
+# запуски по неизменённому файлу не разбирают его лишний раз ради сборки, которая снова не получится
+
+COLUMN_TYPES = {
+    "ts": "q",
+    "side": "b",
+    "amount": "d",
+    "price": "d",
+    "instrument": "i",
+    "base": "i",
+    "quote": "i",
+}
+
+def cache_dir(csv_path):
+    return str(csv_path) + CACHE_SUFFIX
+
+def _source_stamp(csv_path):
+    st = os.stat(resolve_input(csv_path))
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def ts_to_minutes(ts):
+    return (ts - EPOCH) // MINUTE
+
+def minutes_to_ts(minutes):
+    return EPOCH + timedelta(minutes=minutes)
+
+class FillCache:
+    __slots__ = ("rows", "instruments", "currencies", "ts", "side", "amount", "price", "instrument", "base", "quote", "_maps")
+
+    def __init__(self, meta, columns, maps=()):
+        self.rows = meta["rows"]
+        self.instruments = meta["instruments"]
+        self.currencies = meta["currencies"]
+        for name, values in columns.items():
+            setattr(self, name, values)
+        self._maps = list(maps)
+
+    def close(self):
+        for name in COLUMN_TYPES:
+            getattr(self, name).release()
+        for m in self._maps:
+            m.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _write_meta(path, meta):
+    tmp_path = os.path.join(path, "meta.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        json.dump(meta, out)
+    os.replace(tmp_path, os.path.join(path, "meta.json"))
+
+# meta.json кеша, если он построен этой версией по текущему CSV (в том числе отметка "cacheable": false), иначе None
+def _current_meta(csv_path):
+    meta_path = os.path.join(cache_dir(csv_path), "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != CACHE_VERSION or meta.get("source") != _source_stamp(csv_path):
+        return None
+    return meta
+
+# колонки CSV: (columns, instrument_ids, currency_ids) или None, если какая-то строка не разбирается
+def _read_columns(csv_path, parse_ts):
+    columns = {name: array(code) for name, code in COLUMN_TYPES.items()}
+    instrument_ids = {}
+    currency_ids = {}
+    with open_text(csv_path, encoding="utf-8-sig") as f:
+        reader = RecordReader(f, CACHE_COLUMNS)
+        if reader.fieldnames is None or reader.missing:
+            return None
+        ts_col, side_col, amount_col, price_col = columns["ts"], columns["side"], columns["amount"], columns["price"]
+        inst_col, base_col, quote_col = columns["instrument"], columns["base"], columns["quote"]
+        for inst, base, quote, side_raw, amount_raw, price_raw, ts_raw in reader:
+            try:
+                ts = parse_ts(ts_raw)
+                side_f = float(side_raw)
+                side = int(side_f)
+                amount = float(amount_raw)
+                price = float(price_raw)
+            except Exception:
+                return None
+            if side != side_f or side not in (1, -1) or amount <= 0 or price <= 0:
+                return None
+            ts_col.append(ts_to_minutes(ts))
+            side_col.append(side)
+            amount_col.append(amount)
+            price_col.append(price)
+            inst_col.append(instrument_ids.setdefault(inst, len(instrument_ids)))
+            base_col.append(currency_ids.setdefault(base, len(currency_ids)))
+            quote_col.append(currency_ids.setdefault(quote, len(currency_ids)))
+    return columns, instrument_ids, currency_ids
+
+# разбирает CSV в колонки и пишет кеш. возвращает False (и оставляет отметку "cacheable": false), если какая-то
+# строка не разбирается
+def build_cache(csv_path, parse_ts):
+    stamp = _source_stamp(csv_path)
+    parsed = _read_columns(csv_path, parse_ts)
+    path = cache_dir(csv_path)
+    os.makedirs(path, exist_ok=True)
+    if parsed is None:
+        _write_meta(path, {"version": CACHE_VERSION, "source": stamp, "cacheable": False})
+        return False
+    columns, instrument_ids, currency_ids = parsed
+    if os.path.exists(os.path.join(path, "meta.json")):
+        os.remove(os.path.join(path, "meta.json"))
+    for name, values in columns.items():
+        with open(os.path.join(path, name), "wb") as out:
+            values.tofile(out)
+    meta = {
+        "version": CACHE_VERSION,
+        "source": stamp,
+        "rows": len(columns["ts"]),
+        "instruments": list(instrument_ids),
+        "currencies": list(currency_ids),
+    }
+    _write_meta(path, meta) # meta.json пишется последним: без него кеш считается недостроенным
+    return True
+
+# отображает колонки кеша в память. None, если кеша нет, он построен по другой версии CSV или CSV не кешируется
+def open_cache(csv_path):
+    path = cache_dir(csv_path)
+    meta = _current_meta(csv_path)
+    if meta is None or not meta.get("cacheable", True):
+        return None
+    columns = {}
+    maps = []
+    for name, code in COLUMN_TYPES.items():
+        with open(os.path.join(path, name), "rb") as f:
+            if meta["rows"] == 0:
+                columns[name] = memoryview(array(code))
+                continue
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        maps.append(m)
+        columns[name] = memoryview(m).cast(code)
+    return FillCache(meta, columns, maps)
+
+# кеш для csv_path: открывает готовый или строит заново. None, если CSV нельзя закешировать (есть ошибки разбора);
+# повторная сборка не запускается, пока CSV не поменялся
+def load_or_build(csv_path, parse_ts):
+    meta = _current_meta(csv_path)
+    if meta is None:
+        if not build_cache(csv_path, parse_ts):
+            return None
+    elif not meta.get("cacheable", True):
+        return None
+    return open_cache(csv_path)
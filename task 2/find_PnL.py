@@ -1,9 +1,26 @@
+import argparse
 import csv
+from contextlib import nullcontext
 from datetime import datetime
+from multiprocessing import Pool
+from operator import itemgetter
 from pathlib import Path
 
+import metrics
+from external_sort import sorted_fills
+from fill_cache import load_or_build
+from fx_rates import RateIndex, add_fill_rates, add_fill_rates_cached, add_rate_file
+from lots import Position
+from pnl_series import PnLSeries
+from records import RecordReader
+from textio import open_text
+from validate_data import OUTPUT_ISSUES_CSV, FillChecker, check_cached, finish_issues, required_records
+
 INPUT_CSV = "task 2.csv"
 OUTPUT_CSV = "pl_by_instrument.csv"
+FILL_COLUMNS = ("ts", "instrument_exch", "cur_quote", "side", "amount", "price")
+RESULT_COLUMNS = ["instrument", "realized_pl_usd", "unrealized_pl_usd", "total_pl_usd"]
+PARTS_PER_WORKER = 4 # инструменты делятся на workers * PARTS_PER_WORKER частей, чтобы процессы не простаивали
 
 def parse_ts(ts): # конвертация string в дэйттайм который можно сортировать
     parts = ts.strip().split()
@@ -12,81 +29,224 @@ def parse_ts(ts): # конвертация string в дэйттайм котор
     year = 2000 + d[2]
     return datetime(year, d[0], d[1], t[0], t[1])
 
+FILL_CONVERTERS = {"ts": parse_ts, "side": lambda s: int(float(s)), "amount": float, "price": float}
+
+# строка отчёта по позиции: реализованный и нереализованный ПнЛ в USD (см. Position.pl_usd).
+# rates - fx_rates.RateIndex: нереализованный ПнЛ переводится по курсу на момент as_of
+def position_result(instrument, existing_position, rates=None, as_of=None):
+    realized_usd, unrealized_usd, to_usd = existing_position.pl_usd(rates, as_of)
+    return {
+        "instrument": instrument,
+        "realized_pl_usd": round(realized_usd, 5),
+        "unrealized_pl_usd": round(unrealized_usd, 5),
+        "total_pl_usd": round(to_usd, 5),
+    }
+
+
+# все сделки файла в памяти, отсортированные по времени
+def load_sorted_fills(input_path):
+    with open_text(input_path, encoding="utf-8-sig") as f:
+        rows = list(RecordReader(f, FILL_COLUMNS, converters=FILL_CONVERTERS)) # кортежи (ts, instrument, quote, side, amount, price), ts уже дейттайм
+    rows.sort(key=itemgetter(0)) # сортировка датасета по времени
+    return rows
 
-def run(input_path=None, output_path=None):
-    input_path = INPUT_CSV
-    output_path = OUTPUT_CSV
+# то же, что load_sorted_fills, но каждая строка в том же проходе проверяется правилами validate_data
+# (checker - validate_data.FillChecker, проблемы копятся в checker.issues). строки с проблемами пропускаются.
+# rates - fx_rates.RateIndex: в том же проходе в него добавляются цены прошедших проверку сделок (как add_fill_rates)
+def load_validated_fills(input_path, checker, rates=None):
+    with open_text(input_path, encoding="utf-8-sig") as f:
+        rows = []
+        for line_no, row in enumerate(required_records(f), start=2):
+            fill = checker.check(line_no, *row)
+            if fill is not None:
+                rows.append(fill)
+                if rates is not None:
+                    rates.add(fill[0], row[1], fill[2], fill[5])
+    rows.sort(key=itemgetter(0))
+    return rows
 
-    with open(input_path, newline="", encoding="utf-8-sig") as f:
-        rows = list(csv.DictReader(f))
-    rows.sort(key=lambda x: parse_ts(x["ts"].strip())) # сортировка датасета по времени
+# сделки из колоночного кеша (fill_cache.py) в порядке времени, в том же виде, что у load_sorted_fills.
+# в памяти только порядок строк; ts - минуты, а не дейттайм (для мэтчинга нужен только порядок)
+def cached_sorted_fills(cache):
+    ts = cache.ts
+    n = cache.rows
+    if all(ts[i - 1] <= ts[i] for i in range(1, n)):
+        order = range(n)
+    else:
+        order = sorted(range(n), key=ts.__getitem__) # стабильная сортировка - порядок равных ts как у list.sort
+    instruments, currencies = cache.instruments, cache.currencies
+    inst_col, quote_col, side_col, amount_col, price_col = cache.instrument, cache.quote, cache.side, cache.amount, cache.price
+    for i in order:
+        yield ts[i], instruments[inst_col[i]], currencies[quote_col[i]], side_col[i], amount_col[i], price_col[i]
 
+# прогоняет отсортированные по времени сделки через FIFO-мэтчинг, возвращает словарь инструмент -> lots.Position.
+# series - pnl_series.PnLSeries, получает позицию после каждой сделки.
+# rates - fx_rates.RateIndex: реализованный ПнЛ переводится в USD по курсу на время сделки (Position.fill_converted)
+def match_fills(fills, series=None, rates=None):
     by_instrument = {} # открываем словарь в котором будут жить все позиции
-    for r in rows:
-        instrument = r["instrument_exch"]
-        amount = float(r["amount"])
-        price = float(r["price"])
-        side = int(float(r["side"]))
-        if instrument not in by_instrument:
-            by_instrument[instrument] = {"lots": [], "short_lots": [], "realized_quote": 0.0, "quote_ccy": r["cur_quote"], "last_price": price}
-        existing_position = by_instrument[instrument]
-        existing_position["last_price"] = price
-        if side == 1: # если получаем заявку на покупку - смотрим есть ли у нас шорт лоты. если есть - удаляем их до тех пор пока или они не закончатся или заявка не закончится. если лоты закончились раньше - пишем остаток в лонг
-            remaining = amount
-            while remaining > 0 and existing_position["short_lots"]:
-                lot_amount, lot_price = existing_position["short_lots"][0] # самыми первыми уходят самые старые лоты
-                close_amount = min(remaining, lot_amount) # чтобы не превысить случайно размер лота
-                existing_position["realized_quote"] += close_amount * (lot_price - price)
-                remaining -= close_amount
-                if close_amount == lot_amount: # если остаток от позиции >= лота - мы удаляем лот, если нет - уменьшаем его на величину позиции
-                    existing_position["short_lots"].pop(0)
-                else:
-                    existing_position["short_lots"][0] = (lot_amount - close_amount, lot_price)
-            if remaining > 0:
-                existing_position["lots"].append((remaining, price))
-        else: # совершенно аналогичная логика в случае если видим заявку на продажу, только убираем теперь лонг лоты, очевидно
-            remaining = amount
-            while remaining > 0 and existing_position["lots"]:
-                lot_amount, lot_price = existing_position["lots"][0]
-                close_amount = min(remaining, lot_amount)
-                existing_position["realized_quote"] += close_amount * (price - lot_price)
-                remaining -= close_amount
-                if close_amount == lot_amount:
-                    existing_position["lots"].pop(0)
-                else:
-                    existing_position["lots"][0] = (lot_amount - close_amount, lot_price)
-            if remaining > 0:
-                existing_position["short_lots"].append((remaining, price))
+    for ts, instrument, quote_ccy, side, amount, price in fills:
+        existing_position = by_instrument.get(instrument)
+        if existing_position is None:
+            existing_position = by_instrument[instrument] = Position(quote_ccy, price)
+        if rates is None:
+            existing_position.fill(side, amount, price) # мэтчинг с лотами противоположной стороны, см. lots.py
+        else:
+            existing_position.fill_converted(side, amount, price, rates, ts)
+        if series is not None:
+            series.update(ts, instrument, existing_position)
+    if series is not None:
+        series.close()
+    return by_instrument
+
+# раскладывает отсортированные сделки по инструментам (порядок времени внутри инструмента сохраняется)
+# и делит инструменты на parts частей примерно равных по числу сделок - крупные инструменты раскладываются первыми
+def partition_fills(fills, parts):
+    per_instrument = {}
+    for fill in fills:
+        per_instrument.setdefault(fill[1], []).append(fill)
+    partitions = [[] for _ in range(parts)]
+    sizes = [0] * parts
+    for instrument_fills in sorted(per_instrument.values(), key=len, reverse=True):
+        i = sizes.index(min(sizes))
+        partitions[i].extend(instrument_fills)
+        sizes[i] += len(instrument_fills)
+    return [p for p in partitions if p]
+
+_worker_rates = None # индекс курсов в процессе пула (передаётся один раз через initializer, а не с каждой частью)
+
+def _init_worker(rates):
+    global _worker_rates
+    _worker_rates = rates
+
+# мэтчинг одной части в процессе пула. позиции разных инструментов не пересекаются,
+# поэтому результат по каждому инструменту такой же, как при общем проходе
+def match_partition(fills):
+    rates = _worker_rates
+    as_of = rates.as_of if rates is not None else None
+    return [position_result(instrument, existing_position, rates, as_of)
+            for instrument, existing_position in match_fills(fills, rates=rates).items()]
 
+# строки отчёта, посчитанные в workers процессах (по PARTS_PER_WORKER частей на процесс), в порядке инструментов
+def parallel_results(fills, workers, rates=None):
+    partitions = partition_fills(fills, workers * PARTS_PER_WORKER)
     results = []
-    for instrument, existing_position in sorted(by_instrument.items()):
-        quote = existing_position["quote_ccy"]
-        last_price = existing_position["last_price"]
-        realized_quote = existing_position["realized_quote"]
-        lots, short_lots = existing_position["lots"], existing_position["short_lots"]
-        unrealized_quote = 0.0
-        if last_price:
-            for amount, price in lots:
-                unrealized_quote += amount * (last_price - price) # идем лот за лотом и считаем пнл как рост цены инструмента относительно цены покупки
-            for amount, price in short_lots:
-                unrealized_quote += amount * (price - last_price) # точно также считаем пнл, но уже как снижение цены, так как лот на продажу
-        total_quote = realized_quote + unrealized_quote
-        to_usd = (total_quote / last_price) if quote != "USD" else total_quote
-        realized_usd = (realized_quote / last_price) if quote != "USD" else realized_quote
-        unrealized_usd = (unrealized_quote / last_price) if quote != "USD" else unrealized_quote
-        results.append({
-            "instrument": instrument,
-            "realized_pl_usd": round(realized_usd, 5),
-            "unrealized_pl_usd": round(unrealized_usd, 5),
-            "total_pl_usd": round(to_usd, 5),
-        })
+    with Pool(workers, initializer=_init_worker, initargs=(rates,)) as pool:
+        for part in pool.imap_unordered(match_partition, partitions):
+            results.extend(part)
+    results.sort(key=itemgetter("instrument"))
+    return results
+
+# строки отчёта по отсортированным сделкам, отсортированные по инструменту
+def compute_results(fills, workers=0, series=None, rates=None):
+    if workers > 0:
+        return parallel_results(fills, workers, rates)
+    by_instrument = match_fills(fills, series, rates)
+    as_of = rates.as_of if rates is not None else None
+    return [position_result(instrument, existing_position, rates, as_of) for instrument, existing_position in sorted(by_instrument.items())]
+
+# индекс курсов для historical_fx: цены всех сделок файла (или кеша) плюс внешний файл курсов rates_path.
+# rates - индекс, уже заполненный ценами сделок (load_validated_fills): тогда файл сделок второй раз не читается
+def build_rates(input_path, cache=None, rates_path=None, rates=None):
+    if rates is None:
+        rates = RateIndex()
+        if cache is not None:
+            add_fill_rates_cached(rates, cache)
+        else:
+            add_fill_rates(rates, input_path, parse_ts)
+    if rates_path:
+        add_rate_file(rates, rates_path, parse_ts)
+    return rates.freeze()
+
+# max_rows_in_memory - потоковый режим для файлов больше памяти: внешняя сортировка кусками (external_sort.py)
+# use_cache - читать сделки из колоночного кеша (fill_cache.py); если файл не кешируется - обычное чтение CSV
+# workers - мэтчинг по инструментам в workers процессах (сделки всё равно сначала сортируются и раскладываются в памяти,
+# поэтому с max_rows_in_memory не совмещается)
+# series_path - писать кривую ПнЛ (pnl_series.py) после каждой сделки или раз в bucket_minutes; только без workers,
+# т.к. портфельной кривой нужен общий порядок сделок по времени
+# checker - validate_data.FillChecker: проверки validate_data в том же проходе чтения, без отдельного запуска валидатора;
+# проблемы пишутся в issues_path (по умолчанию data_consistency_issues.csv). с кешем проверяются его колонки (check_cached).
+# если проблемы нашлись, ПнЛ не считается, output_path не трогается и возвращается None; с ignore_issues ПнЛ всё равно
+# считается - по строкам без проблем
+# historical_fx - переводить ПнЛ в USD по курсу на момент реализации (fx_rates.py), а не по последней цене инструмента;
+# курсы берутся из цен сделок того же файла и из rates_path (CSV ts,base,quote,rate), если он задан
+def run(input_path=None, output_path=None, max_rows_in_memory=None, use_cache=False, workers=0, series_path=None, bucket_minutes=0,
+        historical_fx=False, rates_path=None, checker=None, issues_path=None, ignore_issues=False):
+    input_path = input_path or INPUT_CSV
+    output_path = output_path or OUTPUT_CSV
+    if series_path and workers > 0:
+        raise ValueError("series output needs the serial path (workers=0)")
+    if max_rows_in_memory and workers > 0:
+        raise ValueError("workers partition all fills in memory, which defeats max_rows_in_memory")
+    if checker is not None and max_rows_in_memory:
+        raise ValueError("inline validation needs the in-memory path (no max_rows_in_memory)")
+
+    cache = load_or_build(input_path, parse_ts) if use_cache else None
+    with cache if cache is not None else nullcontext():
+        fills = None
+        fill_rates = None # цены сделок, собранные при проверке (только historical_fx без кеша)
+        if cache is not None:
+            metrics.report(rows_read=cache.rows)
+        if checker is not None:
+            if cache is not None:
+                checker.issues, checker.instrument_info = check_cached(cache)
+            else:
+                fill_rates = RateIndex() if historical_fx else None
+                fills = load_validated_fills(input_path, checker, fill_rates)
+                metrics.report(rows_read=checker.rows)
+            finish_issues(checker.issues, checker.instrument_info, issues_path or OUTPUT_ISSUES_CSV)
+            if checker.issues and not ignore_issues: # как и pipeline.py с отдельным валидатором: по данным с проблемами отчёт не пишется
+                return None
+
+        rates = build_rates(input_path, cache, rates_path, fill_rates) if historical_fx else None
+        if cache is not None:
+            fills = cached_sorted_fills(cache)
+        elif fills is None:
+            if max_rows_in_memory:
+                fills = sorted_fills(input_path, FILL_COLUMNS, FILL_CONVERTERS, run_rows=max_rows_in_memory) # поток - число строк заранее неизвестно
+            else:
+                fills = load_sorted_fills(input_path)
+                metrics.report(rows_read=len(fills))
+
+        series_file = open(series_path, "w", newline="", encoding="utf-8") if series_path else None
+        series = PnLSeries(series_file, bucket_minutes, rates) if series_file else None
+        try:
+            results = compute_results(fills, workers, series, rates)
+        finally:
+            if series_file:
+                series_file.close()
 
     with open(output_path, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=["instrument", "realized_pl_usd", "unrealized_pl_usd", "total_pl_usd"])
+        w = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
         w.writeheader()
         w.writerows(results)
+    metrics.report(rows_written=len(results))
     return results
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-rows-in-memory", type=int, default=0, help="sort the fills externally in runs of this many rows instead of loading the whole file")
+    parser.add_argument("--cache", action="store_true", help="read the fills from the memory-mapped column cache next to the CSV (built on first use)")
+    parser.add_argument("--workers", type=int, default=0, help="match the fills of different instruments in N worker processes")
+    parser.add_argument("--series", help="also write the PnL curve per instrument and for the portfolio to this CSV")
+    parser.add_argument("--bucket-minutes", type=int, default=0, help="with --series: one point per N-minute bucket instead of one per fill")
+    parser.add_argument("--historical-fx", action="store_true", help="convert PnL to USD at the FX rate of the time it was realized, not the last instrument price")
+    parser.add_argument("--rates-file", help="with --historical-fx: extra FX rates CSV (ts,base,quote,rate) on top of the fill prices")
+    parser.add_argument("--validate", action="store_true", help=f"apply the validate_data.py checks in the same pass and write {OUTPUT_ISSUES_CSV}; exit code 1 on issues")
+    args = parser.parse_args()
+    if args.series and args.workers > 0:
+        parser.error("--series cannot be combined with --workers")
+    if args.max_rows_in_memory and args.workers > 0:
+        parser.error("--workers cannot be combined with --max-rows-in-memory")
+    if args.rates_file and not args.historical_fx:
+        parser.error("--rates-file needs --historical-fx")
+    if args.validate and args.max_rows_in_memory:
+        parser.error("--validate cannot be combined with --max-rows-in-memory")
+    checker = FillChecker() if args.validate else None
+    run(max_rows_in_memory=args.max_rows_in_memory, use_cache=args.cache, workers=args.workers,
+        series_path=args.series, bucket_minutes=args.bucket_minutes, historical_fx=args.historical_fx, rates_path=args.rates_file,
+        checker=checker)
+    if checker is not None:
+        print(f"Issues found: {len(checker.issues)} (see {OUTPUT_ISSUES_CSV})")
+        if checker.issues:
+            raise SystemExit(1)
@@ -0,0 +1,104 @@
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+
+from fill_cache import ts_to_minutes
+from records import RecordReader
+from textio import open_text
+
+RATE_COLUMNS = ("ts", "base", "quote", "rate") # внешний файл курсов: rate - сколько quote за 1 base
+FILL_RATE_COLUMNS = ("ts", "cur_base", "cur_quote", "price")
+
+# индекс курсов валют по времени для перевода ПнЛ в USD на момент реализации.
+# по каждой паре base/quote - отсортированные массивы времени (минуты от 1970-01-01) и цены; курс на момент ts -
+# последняя цена не позже ts (bisect, O(log n)), до первой цены пары - первая цена.
+# курс валюты к USD берётся по паре с USD в любую сторону, иначе через одну промежуточную валюту (EUR/GBP: GBP -> USD
+# через USD/GBP или GBP -> EUR -> USD)
+
+def _minutes(ts):
+    return ts if isinstance(ts, int) else ts_to_minutes(ts)
+
+class RateIndex:
+    def __init__(self):
+        self._pending = {} # (base, quote) -> список (минуты, цена) до freeze()
+        self.series = {} # (base, quote) -> (array минут, array цен)
+        self.neighbours = {} # валюта -> валюты, с которыми у неё есть пара
+        self.as_of = None # время последней цены в индексе
+
+    def add(self, ts, base, quote, price):
+        if not base or not quote or base == quote or not price > 0:
+            return
+        self._pending.setdefault((base, quote), []).append((_minutes(ts), price))
+
+    # сортирует накопленные цены по времени (стабильно - порядок цен одной минуты сохраняется) и упаковывает в массивы
+    def freeze(self):
+        for pair, points in self._pending.items():
+            points.sort(key=lambda p: p[0])
+            old_times, old_prices = self.series.get(pair, ((), ()))
+            if old_times:
+                points = sorted(list(zip(old_times, old_prices)) + points, key=lambda p: p[0])
+            self.series[pair] = (array("q", [t for t, _ in points]), array("d", [p for _, p in points]))
+            base, quote = pair
+            self.neighbours.setdefault(base, set()).add(quote)
+            self.neighbours.setdefault(quote, set()).add(base)
+        self._pending = {}
+        self.as_of = max((times[-1] for times, _ in self.series.values()), default=None)
+        return self
+
+    def _price(self, pair, minutes):
+        times, prices = self.series[pair]
+        i = bisect_right(times, minutes) - 1
+        return prices[max(i, 0)]
+
+    # сколько to за 1 frm на момент minutes, None - пары нет
+    def _rate(self, frm, to, minutes):
+        if (frm, to) in self.series:
+            return self._price((frm, to), minutes)
+        if (to, frm) in self.series:
+            return 1.0 / self._price((to, frm), minutes)
+        return None
+
+    # сколько USD за 1 ccy на момент ts
+    def usd_rate(self, ccy, ts):
+        if ccy == "USD":
+            return 1.0
+        minutes = _minutes(ts)
+        direct = self._rate(ccy, "USD", minutes)
+        if direct is not None:
+            return direct
+        for via in sorted(self.neighbours.get(ccy, ())):
+            to_usd = self._rate(via, "USD", minutes)
+            if to_usd is not None:
+                return self._rate(ccy, via, minutes) * to_usd
+        raise KeyError(f"no USD rate for {ccy} (no pair with USD or with a currency that has one)")
+
+    def to_usd(self, amount, ccy, ts):
+        if ccy == "USD":
+            return amount
+        return amount * self.usd_rate(ccy, ts)
+
+# цены всех сделок файла (порядок строк не важен)
+def add_fill_rates(index, input_path, parse_ts):
+    with open_text(input_path, encoding="utf-8-sig") as f:
+        for ts, base, quote, price in RecordReader(f, FILL_RATE_COLUMNS, converters={"ts": parse_ts, "price": float}):
+            index.add(ts, base, quote, price)
+
+def add_fill_rates_cached(index, cache):
+    currencies = cache.currencies
+    ts_col, base_col, quote_col, price_col = cache.ts, cache.base, cache.quote, cache.price
+    for i in range(cache.rows):
+        index.add(ts_col[i], currencies[base_col[i]], currencies[quote_col[i]], price_col[i])
+
+# внешний файл курсов (колонки RATE_COLUMNS); ts в формате сделок (parse_ts) или ISO
+def add_rate_file(index, path, parse_ts):
+    def parse_any(value):
+        try:
+            return parse_ts(value)
+        except (ValueError, IndexError):
+            return datetime.fromisoformat(value)
+    with open_text(path, encoding="utf-8-sig") as f:
+        reader = RecordReader(f, RATE_COLUMNS, converters={"ts": parse_any, "rate": float})
+        if reader.missing:
+            raise ValueError(f"{path}: missing columns {reader.missing}")
+        for ts, base, quote, rate in reader:
+            index.add(ts, base, quote, rate)
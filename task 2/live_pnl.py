@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import csv
+import os
+import signal
+import sys
+
+from find_PnL import FILL_COLUMNS, FILL_CONVERTERS, RESULT_COLUMNS, position_result
+from lots import Position
+
+LIVE_OUTPUT_CSV = "pl_live.csv"
+SNAPSHOT_INTERVAL = 1.0 # секунды между публикациями снапшота
+POLL_INTERVAL = 0.1 # как часто проверяем хвост файла на новые строки
+SNAPSHOT_COMMAND = "SNAPSHOT" # строка, на которую клиент сокета получает текущий снапшот
+
+# долгоживущий режим find_PnL: сделки приходят по одной (хвост файла, сокет или stdin), позиции по инструментам
+# живут в памяти в тех же lots.Position, что и в пакетном режиме - сделка обрабатывается за O(1) амортизированно,
+# снапшот (те же колонки, что pl_by_instrument.csv) считается за O(число инструментов).
+# каждый источник - CSV: первая строка - заголовок, дальше сделки. сделки мэтчатся в порядке прихода,
+# а не сортируются по ts, как в пакетном режиме
+
+class LivePnL:
+    def __init__(self):
+        self.by_instrument = {}
+        self.fills = 0
+        self.rejected = 0
+        self.changed = False # были ли сделки с последней публикации
+
+    def apply(self, fill):
+        _ts, instrument, quote_ccy, side, amount, price = fill
+        existing_position = self.by_instrument.get(instrument)
+        if existing_position is None:
+            existing_position = self.by_instrument[instrument] = Position(quote_ccy, price)
+        existing_position.fill(side, amount, price)
+        self.fills += 1
+        self.changed = True
+
+    def snapshot(self):
+        return [position_result(instrument, existing_position) for instrument, existing_position in sorted(self.by_instrument.items())]
+
+    # пишет снапшот в path атомарно (через .tmp), печатает итог по портфелю
+    def publish(self, path):
+        results = self.snapshot()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+            w.writeheader()
+            w.writerows(results)
+        os.replace(tmp_path, path)
+        self.changed = False
+        total = sum(r["total_pl_usd"] for r in results)
+        print(f"{self.fills} fills, {len(results)} instruments, total_pl_usd={total:.5f} -> {path}", flush=True)
+
+# разбор строк одного источника: индексы колонок FILL_COLUMNS берутся из заголовка источника
+class FillParser:
+    def __init__(self, header_line):
+        header = [h.strip() for h in next(csv.reader([header_line.lstrip("\ufeff")]))]
+        missing = [c for c in FILL_COLUMNS if c not in header]
+        if missing:
+            raise ValueError(f"Missing required columns: {missing}")
+        self.indexes = [header.index(c) for c in FILL_COLUMNS]
+        self.converters = [FILL_CONVERTERS.get(c) for c in FILL_COLUMNS]
+        self.width = max(self.indexes) + 1
+
+    # кортеж (ts, instrument, quote, side, amount, price) как у find_PnL, None для пустой строки
+    def parse(self, line):
+        row = next(csv.reader([line]), None)
+        if not row or not any(v.strip() for v in row):
+            return None
+        if len(row) < self.width:
+            row += [""] * (self.width - len(row))
+        values = []
+        for i, convert in zip(self.indexes, self.converters):
+            v = row[i].strip()
+            values.append(convert(v) if convert else v)
+        return tuple(values)
+
+# применяет сделки из асинхронного итератора строк. битые строки пропускаются с сообщением в stderr
+async def consume(lines, book, name):
+    parser = None
+    async for line in lines:
+        if parser is None:
+            if not line.strip():
+                continue
+            parser = FillParser(line)
+            continue
+        try:
+            fill = parser.parse(line)
+        except Exception as e:
+            book.rejected += 1
+            print(f"{name}: skipped bad fill {line.strip()!r} ({e})", file=sys.stderr)
+            continue
+        if fill is not None:
+            book.apply(fill)
+
+# строки файла path с начала и дальше по мере дописывания (как tail -f). недописанная строка ждёт перевода строки
+async def tail_lines(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        pending = ""
+        while True:
+            chunk = f.readline()
+            if not chunk:
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            pending += chunk
+            if pending.endswith("\n"):
+                yield pending
+                pending = ""
+
+# строки stdin; чтение в отдельном потоке, чтобы не блокировать цикл (и работать с перенаправленным файлом и на Windows)
+async def stdin_lines():
+    while True:
+        line = await asyncio.to_thread(sys.stdin.readline)
+        if not line:
+            return
+        yield line
+
+# сокет: HOST:PORT - TCP, иначе путь к unix-сокету. каждое подключение - отдельный CSV-поток с заголовком;
+# строка SNAPSHOT_COMMAND вместо сделки - ответить текущим снапшотом в виде CSV
+async def start_listener(address, book):
+    async def handle(reader, writer):
+        async def lines():
+            async for raw in reader:
+                line = raw.decode("utf-8")
+                if line.strip() == SNAPSHOT_COMMAND:
+                    w = csv.DictWriter(_StreamText(writer), fieldnames=RESULT_COLUMNS)
+                    w.writeheader()
+                    w.writerows(book.snapshot())
+                    await writer.drain()
+                    continue
+                yield line
+        try:
+            await consume(lines(), book, "socket")
+        except ValueError as e:
+            print(f"socket: {e}", file=sys.stderr)
+        finally:
+            writer.close()
+
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return await asyncio.start_server(handle, host or "127.0.0.1", int(port))
+    return await asyncio.start_unix_server(handle, address)
+
+class _StreamText:
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, text):
+        self.writer.write(text.encode("utf-8"))
+
+async def publish_every(book, path, interval):
+    while True:
+        await asyncio.sleep(interval)
+        if book.changed:
+            book.publish(path)
+
+async def serve(args):
+    book = LivePnL()
+    sources = []
+    server = None
+    if args.follow:
+        sources.append(consume(tail_lines(args.follow), book, args.follow))
+    if args.stdin:
+        sources.append(consume(stdin_lines(), book, "stdin"))
+    if args.listen:
+        server = await start_listener(args.listen, book)
+        sources.append(server.serve_forever())
+
+    loop = asyncio.get_running_loop()
+    if hasattr(signal, "SIGUSR1"): # снапшот по запросу: kill -USR1 <pid>; по SIGTERM - остановка с финальным снапшотом
+        loop.add_signal_handler(signal.SIGUSR1, book.publish, args.output)
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    publisher = asyncio.create_task(publish_every(book, args.output, args.interval))
+    try:
+        await asyncio.gather(*sources)
+    finally:
+        publisher.cancel()
+        if server is not None:
+            server.close()
+        book.publish(args.output) # финальный снапшот, когда источники закончились (EOF на stdin) или сервис остановлен
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--follow", help="tail this CSV file and apply fills as lines are appended")
+    parser.add_argument("--listen", help="accept CSV fill streams on HOST:PORT (TCP) or on a unix socket path")
+    parser.add_argument("--stdin", action="store_true", help="read a CSV fill stream from stdin (ends at EOF)")
+    parser.add_argument("--output", default=LIVE_OUTPUT_CSV, help="snapshot CSV, rewritten atomically on each publish")
+    parser.add_argument("--interval", type=float, default=SNAPSHOT_INTERVAL, help="seconds between snapshots (only published if fills arrived)")
+    args = parser.parse_args()
+    if not (args.follow or args.listen or args.stdin):
+        parser.error("give at least one of --follow, --listen, --stdin")
+    try:
+        asyncio.run(serve(args))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
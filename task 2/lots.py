@@ -0,0 +1,128 @@
+# позиция по инструменту для FIFO-мэтчинга из find_PnL.py.
+# лоты одной стороны лежат в LotBook: параллельные списки объёмов и цен плюс индекс головы очереди,
+# так что закрытие самого старого лота - это сдвиг индекса за O(1), а не list.pop(0) за O(n).
+# LotBook ведёт общий открытый объём и cost basis (сумма amount * price по открытым лотам),
+# поэтому нереализованный ПнЛ считается за O(1), без прохода по всем лотам
+
+COMPACT_MIN = 1024 # закрытые лоты в начале списков выкидываются, когда их больше COMPACT_MIN и больше половины
+
+class LotBook:
+    __slots__ = ("amounts", "prices", "head", "quantity", "cost")
+
+    def __init__(self):
+        self.amounts = []
+        self.prices = []
+        self.head = 0 # индекс самого старого открытого лота
+        self.quantity = 0.0
+        self.cost = 0.0
+
+    def __len__(self):
+        return len(self.amounts) - self.head
+
+    def __bool__(self):
+        return self.head < len(self.amounts)
+
+    # открытые лоты (amount, price) от старого к новому
+    def __iter__(self):
+        return zip(self.amounts[self.head:], self.prices[self.head:])
+
+    def add(self, amount, price):
+        self.amounts.append(amount)
+        self.prices.append(price)
+        self.quantity += amount
+        self.cost += amount * price
+
+    # закрывает лоты с головы очереди объёмом amount по цене price. direction=1 - закрываем лонг (ПнЛ = price - цена лота),
+    # direction=-1 - шорт (ПнЛ = цена лота - price). ПнЛ прибавляется к realized в том же порядке, что и раньше в find_PnL.
+    # возвращает (незакрытый остаток amount, новый realized)
+    def close(self, amount, price, realized, direction):
+        amounts, prices = self.amounts, self.prices
+        head, end = self.head, len(amounts)
+        remaining = amount
+        while remaining > 0 and head < end:
+            lot_amount, lot_price = amounts[head], prices[head] # самыми первыми уходят самые старые лоты
+            close_amount = min(remaining, lot_amount) # чтобы не превысить случайно размер лота
+            if direction == 1:
+                realized += close_amount * (price - lot_price)
+            else:
+                realized += close_amount * (lot_price - price)
+            remaining -= close_amount
+            self.quantity -= close_amount
+            self.cost -= close_amount * lot_price
+            if close_amount == lot_amount: # лот закрыт целиком - двигаем голову, иначе уменьшаем его на месте
+                head += 1
+            else:
+                amounts[head] = lot_amount - close_amount
+        if head == end: # книга пустая - сбрасываем накопленную погрешность
+            amounts.clear()
+            prices.clear()
+            head = 0
+            self.quantity = 0.0
+            self.cost = 0.0
+        elif head > COMPACT_MIN and head * 2 > end:
+            del amounts[:head]
+            del prices[:head]
+            head = 0
+        self.head = head
+        return remaining, realized
+
+class Position:
+    __slots__ = ("lots", "short_lots", "realized_quote", "realized_usd", "quote_ccy", "last_price")
+
+    def __init__(self, quote_ccy, last_price):
+        self.lots = LotBook()
+        self.short_lots = LotBook()
+        self.realized_quote = 0.0
+        self.realized_usd = 0.0 # только для fill_converted
+        self.quote_ccy = quote_ccy
+        self.last_price = last_price
+
+    # заявка на покупку сначала закрывает шорт лоты, остаток идёт в лонг; продажа - наоборот.
+    # в каждый момент открыты или только лонг лоты, или только шорт лоты. возвращает ПнЛ, реализованный этой сделкой
+    # (realized_quote копится в том же порядке сложения, что и раньше, поэтому разница - с точностью до округления)
+    def fill(self, side, amount, price):
+        self.last_price = price
+        before = self.realized_quote
+        if side == 1:
+            remaining, self.realized_quote = self.short_lots.close(amount, price, before, -1)
+            if remaining > 0:
+                self.lots.add(remaining, price)
+        else:
+            remaining, self.realized_quote = self.lots.close(amount, price, before, 1)
+            if remaining > 0:
+                self.short_lots.add(remaining, price)
+        return self.realized_quote - before
+
+    # то же, что fill, но ПнЛ, реализованный этой сделкой, сразу переводится в USD по курсу на её время ts
+    # (rates - fx_rates.RateIndex) и копится в realized_usd
+    def fill_converted(self, side, amount, price, rates, ts):
+        realized = self.fill(side, amount, price)
+        if realized:
+            self.realized_usd += rates.to_usd(realized, self.quote_ccy, ts)
+
+    # нереализованный ПнЛ в валюте котировки по цене last_price (по умолчанию - последняя цена сделки)
+    def unrealized_quote(self, last_price=None):
+        if last_price is None:
+            last_price = self.last_price
+        if not last_price:
+            return 0.0
+        lots, short_lots = self.lots, self.short_lots
+        return (lots.quantity * last_price - lots.cost) + (short_lots.cost - short_lots.quantity * last_price)
+
+    # открытый объём со знаком: > 0 - лонг, < 0 - шорт
+    def net_quantity(self):
+        return self.lots.quantity - self.short_lots.quantity
+
+    # (realized, unrealized, total) в USD. позиция считается в валюте котировки, поэтому если котировка не USD -
+    # делим на последнюю цену (курс). с rates (после fill_converted) реализованный ПнЛ уже в USD по курсам на моменты
+    # реализации, а нереализованный переводится по курсу на момент as_of
+    def pl_usd(self, rates=None, as_of=None):
+        if rates is not None:
+            unrealized_usd = rates.to_usd(self.unrealized_quote(), self.quote_ccy, as_of)
+            return self.realized_usd, unrealized_usd, self.realized_usd + unrealized_usd
+        last_price = self.last_price
+        realized_quote = self.realized_quote
+        unrealized_quote = self.unrealized_quote() # открытый объём * последняя цена - cost basis, без прохода по лотам
+        if self.quote_ccy == "USD":
+            return realized_quote, unrealized_quote, realized_quote + unrealized_quote
+        return realized_quote / last_price, unrealized_quote / last_price, (realized_quote + unrealized_quote) / last_price
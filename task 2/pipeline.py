@@ -1,25 +1,54 @@
-import subprocess
+import argparse
 import sys
+import time
 from pathlib import Path
 
+import metrics
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 STEPS = [
     "validate_data.py",
     "find_PnL.py",
 ]
 
-def main():
-    for name in STEPS:
+# cache=True - оба шага читают сделки из общего колоночного кеша (fill_cache.py): CSV разбирается один раз на оба.
+# inline_validation - один шаг find_PnL.py --validate: проверки validate_data делаются в том же проходе, что и мэтчинг.
+# metrics_path - JSON-отчёт с метриками шагов (metrics.py), profile - имя шага, который запускается под cProfile
+def main(cache=False, metrics_path=None, trace_memory=False, profile=None, inline_validation=False):
+    extra = ["--cache"] if cache else []
+    names = STEPS
+    if inline_validation:
+        names = ["find_PnL.py"]
+        extra.append("--validate")
+    started = time.time()
+    steps = []
+    for name in names:
         path = SCRIPT_DIR / name
         if not path.exists():
             print(f"Missing script: {path}", file=sys.stderr)
             sys.exit(1)
         print(f"Running {name} ...")
-        r = subprocess.run([sys.executable, str(path)], cwd=SCRIPT_DIR)
-        if r.returncode != 0:
-            print(f"{name} failed with exit code {r.returncode}", file=sys.stderr)
-            sys.exit(r.returncode)
+        profile_path = SCRIPT_DIR / (Path(name).stem + ".prof") if profile == name else None
+        returncode, step = metrics.run_step(path, extra, cwd=SCRIPT_DIR, profile_path=profile_path, trace_memory=trace_memory)
+        steps.append(dict(name=name, returncode=returncode, **step))
+        if returncode != 0:
+            print(f"{name} failed with exit code {returncode}", file=sys.stderr)
+            if metrics_path:
+                metrics.write_report(metrics_path, steps, started)
+            sys.exit(returncode)
+    if metrics_path:
+        metrics.write_report(metrics_path, steps, started)
+        print(f"Metrics written to {metrics_path}")
     print("Done.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache", action="store_true", help="share a memory-mapped column cache of the fills between the steps")
+    parser.add_argument("--metrics", help="write a JSON report with per-step time, CPU, rows, I/O bytes and peak memory to this path")
+    parser.add_argument("--tracemalloc", action="store_true", help="also record the tracemalloc peak of every step (slower)")
+    parser.add_argument("--profile", choices=STEPS, help="run this step under cProfile, stats go to <step>.prof")
+    parser.add_argument("--inline-validation", action="store_true", help="validate inside find_PnL.py in the same pass instead of a separate validate_data.py step")
+    args = parser.parse_args()
+    if args.inline_validation and args.profile == "validate_data.py":
+        parser.error("--profile validate_data.py has no step to profile with --inline-validation")
+    main(cache=args.cache, metrics_path=args.metrics, trace_memory=args.tracemalloc, profile=args.profile, inline_validation=args.inline_validation)
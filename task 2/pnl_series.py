@@ -0,0 +1,57 @@
+import csv
+
+from fill_cache import minutes_to_ts, ts_to_minutes
+
+SERIES_COLUMNS = ["ts", "instrument", "position", "realized_pl_usd", "unrealized_pl_usd", "total_pl_usd"]
+PORTFOLIO = "PORTFOLIO" # значение колонки instrument для строк по всему портфелю
+TS_FORMAT = "%Y-%m-%d %H:%M"
+
+# кривая ПнЛ по инструментам и портфелю, пишется в CSV по ходу мэтчинга.
+# bucket_minutes=0 - точка после каждой сделки, иначе - в конце каждого бакета, в котором были сделки
+# (ts точки - начало бакета, строки только по инструментам, торговавшимся в бакете, плюс портфель).
+# ПнЛ инструмента меняется только на его сделках (оценка по последней цене сделки), поэтому точка стоит O(1):
+# Position.pl_usd считается по накопленным объёму и cost basis, а портфель - как сумма, в которую
+# вносится разница между новой и прошлой оценкой инструмента.
+# rates - fx_rates.RateIndex при --historical-fx: нереализованный ПнЛ точки - по курсу на её время
+
+class PnLSeries:
+    def __init__(self, f, bucket_minutes=0, rates=None):
+        self.writer = csv.writer(f)
+        self.writer.writerow(SERIES_COLUMNS)
+        self.bucket_minutes = bucket_minutes
+        self.bucket = None
+        self.pending = {} # инструмент -> Position, изменившиеся с последней точки
+        self.marks = {} # инструмент -> (realized, unrealized, total) в USD на последней точке
+        self.portfolio = [0.0, 0.0, 0.0]
+        self.rates = rates
+
+    # вызывается после каждой сделки: ts - дейттайм или минуты от 1970-01-01 (как в колоночном кеше)
+    def update(self, ts, instrument, existing_position):
+        minutes = ts if isinstance(ts, int) else ts_to_minutes(ts)
+        if not self.bucket_minutes:
+            self.pending[instrument] = existing_position
+            self.emit(minutes)
+            return
+        bucket = minutes // self.bucket_minutes
+        if bucket != self.bucket and self.pending:
+            self.emit(self.bucket * self.bucket_minutes)
+        self.bucket = bucket
+        self.pending[instrument] = existing_position
+
+    def emit(self, minutes):
+        ts = minutes_to_ts(minutes).strftime(TS_FORMAT)
+        portfolio = self.portfolio
+        for instrument, existing_position in self.pending.items():
+            mark = existing_position.pl_usd(self.rates, minutes)
+            old = self.marks.get(instrument, (0.0, 0.0, 0.0))
+            for i in range(3):
+                portfolio[i] += mark[i] - old[i]
+            self.marks[instrument] = mark
+            self.writer.writerow([ts, instrument, round(existing_position.net_quantity(), 5)] + [round(v, 5) for v in mark])
+        self.writer.writerow([ts, PORTFOLIO, ""] + [round(v, 5) for v in portfolio])
+        self.pending.clear()
+
+    # последняя незакрытая точка (в режиме бакетов)
+    def close(self):
+        if self.pending:
+            self.emit(self.bucket * self.bucket_minutes)
@@ -0,0 +1,79 @@
+import csv
+from operator import itemgetter
+
+# общий модуль: task 1/records.py и task 2/records.py должны совпадать побайтно (задачи - отдельные папки скриптов без общего пакета),
+# правки вносить в обе копии; tests/test_shared_modules.py в task 1 это проверяет
+# читатель CSV без словаря на каждую строку (замена csv.DictReader в горячих циклах).
+# позиции колонок находятся по заголовку один раз, строки отдаются кортежами только нужных колонок
+# в порядке columns, каждое поле один раз делается strip() и, если задан конвертер, приводится к типу
+
+# конвертер, который вместо исключения возвращает None (пустые или кривые поля, которые код дальше умеет пропускать)
+def lenient(convert):
+    def wrapped(val):
+        try:
+            return convert(val)
+        except (TypeError, ValueError):
+            return None
+    return wrapped
+
+def _strip_then(convert):
+    def wrapped(val):
+        return convert(val.strip())
+    return wrapped
+
+class RecordReader:
+    __slots__ = ("fieldnames", "columns", "missing", "_reader", "_width", "_get", "_convert")
+
+    # fieldnames - как у DictReader: если заданы, первая строка f считается данными, а не заголовком
+    def __init__(self, f, columns, converters=None, fieldnames=None):
+        self._reader = csv.reader(f)
+        self.fieldnames = list(fieldnames) if fieldnames is not None else next(self._reader, None)
+        self.columns = tuple(columns)
+        header = self.fieldnames or []
+        self.missing = [c for c in self.columns if c not in header]
+        self._width = len(header)
+        if self.missing:
+            self._get = None
+            return
+        positions = [header.index(c) for c in self.columns]
+        get = itemgetter(*positions)
+        self._get = get if len(positions) > 1 else (lambda raw: (get(raw),))
+        converters = converters or {}
+        self._convert = tuple(_strip_then(converters[c]) if c in converters else str.strip for c in self.columns)
+
+    # номер последней прочитанной строки файла (с учётом переносов внутри кавычек)
+    @property
+    def line_num(self):
+        return self._reader.line_num
+
+    def _check(self):
+        if self.fieldnames is None:
+            raise ValueError("CSV has no header")
+        if self.missing:
+            raise ValueError(f"Missing columns: {self.missing}")
+
+    # исходные строки как списки (дополненные пустыми полями до ширины заголовка, как у DictReader)
+    def raw_rows(self):
+        self._check()
+        width = self._width
+        for raw in self._reader:
+            if not raw:
+                continue
+            if len(raw) < width:
+                raw += [""] * (width - len(raw))
+            yield raw
+
+    # кортеж нужных колонок из исходной строки
+    def project(self, raw):
+        return tuple([convert(val) for convert, val in zip(self._convert, self._get(raw))])
+
+    def __iter__(self):
+        project = self.project
+        for raw in self.raw_rows():
+            yield project(raw)
+
+    # пары (исходная строка, кортеж колонок) - когда строку нужно записать дальше целиком
+    def pairs(self):
+        project = self.project
+        for raw in self.raw_rows():
+            yield raw, project(raw)
@@ -0,0 +1,28 @@
+import csv
+
+import batch_pnl
+
+HEADER = ["instrument_exch", "cur_base", "cur_quote", "side", "amount", "price", "ts"]
+CLEAN = [["USD/BRL", "USD", "BRL", "1", "10", "5.1", "1/16/23 0:00"], ["USD/BRL", "USD", "BRL", "-1", "4", "5.2", "1/16/23 0:01"]]
+
+def write_fills(path, rows):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        csv.writer(f).writerows([HEADER] + rows)
+
+def test_directory_input_skips_outputs(tmp_path):
+    for name in ("acc_a.csv", "acc_b.csv", "pl_by_instrument.csv", "data_consistency_issues.csv", "pl_by_account.csv", "acc_a.pl.csv", "acc_a.issues.csv"):
+        write_fills(tmp_path / name, CLEAN)
+    assert [account for account, _path in batch_pnl.find_inputs(str(tmp_path))] == ["acc_a", "acc_b"]
+    assert len(batch_pnl.find_inputs(str(tmp_path / "*.csv"))) == 7 # явная маска берётся как есть
+
+def test_invalid_file_gets_no_report_unless_ignored(tmp_path):
+    write_fills(tmp_path / "acc.csv", CLEAN + [["USD/BRL", "USD", "BRL", "2", "10", "5.3", "1/16/23 0:02"]])
+    out_dir = tmp_path / "out"
+    statuses = batch_pnl.run_batch(str(tmp_path), str(out_dir))
+    assert [(s["status"], s["issues"]) for s in statuses] == [("invalid", 1)]
+    assert (out_dir / "acc.issues.csv").exists() and not (out_dir / "acc.pl.csv").exists()
+
+    statuses = batch_pnl.run_batch(str(tmp_path), str(out_dir), ignore_issues=True)
+    assert [(s["status"], s["issues"]) for s in statuses] == [("ok", 1)]
+    with open(out_dir / "acc.pl.csv", newline="", encoding="utf-8") as f:
+        assert [row["instrument"] for row in csv.DictReader(f)] == ["USD/BRL"]
@@ -0,0 +1,46 @@
+import csv
+import os
+
+import fill_cache
+from fill_cache import load_or_build
+from validate_data import parse_ts
+
+HEADER = ["instrument_exch", "cur_base", "cur_quote", "side", "amount", "price", "ts"]
+
+def write_fills(path, rows):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        csv.writer(f).writerows([HEADER] + rows)
+
+# считает разборы CSV при сборке кеша
+def count_builds(monkeypatch):
+    calls = []
+    read_columns = fill_cache._read_columns
+    def counted(*args):
+        calls.append(args)
+        return read_columns(*args)
+    monkeypatch.setattr(fill_cache, "_read_columns", counted)
+    return calls
+
+def test_cache_is_built_once(tmp_path, monkeypatch):
+    path = tmp_path / "fills.csv"
+    write_fills(path, [["USD/BRL", "USD", "BRL", "1", "10", "5.1", "1/16/23 0:00"]])
+    builds = count_builds(monkeypatch)
+    for _ in range(2):
+        with load_or_build(path, parse_ts) as cache:
+            assert cache.rows == 1 and cache.instruments == ["USD/BRL"]
+    assert len(builds) == 1
+
+def test_failed_build_is_not_retried_until_csv_changes(tmp_path, monkeypatch):
+    path = tmp_path / "fills.csv"
+    write_fills(path, [["USD/BRL", "USD", "BRL", "2", "10", "5.1", "1/16/23 0:00"]])
+    builds = count_builds(monkeypatch)
+    assert load_or_build(path, parse_ts) is None
+    assert load_or_build(path, parse_ts) is None
+    assert len(builds) == 1
+
+    write_fills(path, [["USD/BRL", "USD", "BRL", "1", "10", "5.1", "1/16/23 0:00"]])
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9)) # размер тот же - отличается только mtime
+    with load_or_build(path, parse_ts) as cache:
+        assert cache.rows == 1
+    assert len(builds) == 2
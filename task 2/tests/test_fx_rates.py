@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import pytest
+
+from fill_cache import ts_to_minutes
+from fx_rates import RateIndex
+from lots import Position
+
+T0 = datetime(2023, 1, 16, 10, 0)
+
+def at(minutes):
+    return ts_to_minutes(T0) + minutes
+
+def index(*points):
+    rates = RateIndex()
+    for minutes, base, quote, price in points:
+        rates.add(at(minutes), base, quote, price)
+    return rates.freeze()
+
+def test_direct_pair_uses_last_price_not_after_ts():
+    rates = index((0, "EUR", "USD", 1.10), (10, "EUR", "USD", 1.20))
+    assert rates.usd_rate("EUR", at(0)) == 1.10
+    assert rates.usd_rate("EUR", at(9)) == 1.10
+    assert rates.usd_rate("EUR", at(10)) == 1.20
+    assert rates.usd_rate("EUR", at(1000)) == 1.20
+    assert rates.to_usd(100.0, "EUR", at(5)) == pytest.approx(110.0)
+    assert rates.as_of == at(10)
+
+def test_before_first_rate_uses_first_price():
+    rates = index((10, "EUR", "USD", 1.20), (20, "EUR", "USD", 1.30))
+    assert rates.usd_rate("EUR", at(-100)) == 1.20
+
+def test_inverse_pair():
+    rates = index((0, "USD", "BRL", 5.0), (10, "USD", "BRL", 4.0))
+    assert rates.usd_rate("BRL", at(5)) == pytest.approx(0.2)
+    assert rates.usd_rate("BRL", at(10)) == pytest.approx(0.25)
+
+def test_cross_rate_through_one_currency():
+    # у EUR нет пары с USD: EUR -> GBP по EUR/GBP, GBP -> USD по обратной USD/GBP
+    rates = index((0, "EUR", "GBP", 0.85), (0, "USD", "GBP", 0.80), (10, "USD", "GBP", 0.75))
+    assert rates.usd_rate("EUR", at(5)) == pytest.approx(0.85 / 0.80)
+    assert rates.usd_rate("EUR", at(10)) == pytest.approx(0.85 / 0.75)
+
+def test_unknown_currency_raises():
+    rates = index((0, "EUR", "USD", 1.1))
+    with pytest.raises(KeyError):
+        rates.usd_rate("JPY", at(0))
+    assert rates.usd_rate("USD", at(0)) == 1.0
+
+def test_invalid_points_are_ignored():
+    rates = index((0, "EUR", "USD", 0.0), (0, "", "USD", 1.0), (0, "USD", "USD", 1.0), (5, "EUR", "USD", 1.1))
+    assert list(rates.series) == [("EUR", "USD")]
+    assert rates.usd_rate("EUR", at(0)) == 1.1
+
+def test_same_minute_keeps_insertion_order():
+    rates = index((0, "EUR", "USD", 1.1), (0, "EUR", "USD", 1.3))
+    assert rates.usd_rate("EUR", at(0)) == 1.3
+
+def test_freeze_merges_with_existing_series():
+    rates = index((0, "EUR", "USD", 1.1), (20, "EUR", "USD", 1.3))
+    rates.add(at(10), "EUR", "USD", 1.2)
+    rates.add(at(20), "EUR", "USD", 1.4) # та же минута, что у уже замороженной цены - побеждает новая
+    rates.add(at(5), "USD", "BRL", 5.0)
+    rates.freeze()
+    times, prices = rates.series[("EUR", "USD")]
+    assert list(times) == [at(0), at(10), at(20), at(20)]
+    assert list(prices) == [1.1, 1.2, 1.3, 1.4]
+    assert rates.usd_rate("EUR", at(15)) == 1.2
+    assert rates.usd_rate("EUR", at(20)) == 1.4
+    assert rates.usd_rate("BRL", at(5)) == pytest.approx(0.2)
+    assert rates.as_of == at(20)
+
+FILLS = [(1, 10.0, 100.0), (-1, 4.0, 103.0), (-1, 10.0, 98.5), (1, 3.0, 97.0), (1, 5.0, 99.25)]
+
+def test_fill_converted_realizes_same_quote_pnl_as_fill():
+    rates = index((0, "USD", "BRL", 5.0), (2, "USD", "BRL", 4.0))
+    plain = Position("BRL", FILLS[0][2])
+    converted = Position("BRL", FILLS[0][2])
+    for minutes, (side, amount, price) in enumerate(FILLS):
+        plain.fill(side, amount, price)
+        converted.fill_converted(side, amount, price, rates, at(minutes))
+        assert converted.realized_quote == plain.realized_quote
+        assert list(converted.lots) == list(plain.lots)
+        assert list(converted.short_lots) == list(plain.short_lots)
+    assert converted.unrealized_quote() == plain.unrealized_quote()
+
+def test_fill_converted_uses_rate_at_each_close():
+    rates = index((0, "USD", "BRL", 5.0), (2, "USD", "BRL", 4.0))
+    position = Position("BRL", 100.0)
+    expected_usd = 0.0
+    for minutes, (side, amount, price) in enumerate(FILLS):
+        before = position.realized_quote
+        position.fill_converted(side, amount, price, rates, at(minutes))
+        expected_usd += (position.realized_quote - before) / (5.0 if minutes < 2 else 4.0)
+    assert position.realized_usd == pytest.approx(expected_usd)
+    realized_usd, unrealized_usd, total_usd = position.pl_usd(rates, rates.as_of)
+    assert realized_usd == position.realized_usd
+    assert unrealized_usd == pytest.approx(position.unrealized_quote() / 4.0)
+    assert total_usd == pytest.approx(realized_usd + unrealized_usd)
@@ -0,0 +1,38 @@
+import csv
+
+import find_PnL
+from validate_data import FillChecker
+
+# find_PnL.run с checker: строки с проблемами в мэтчинг не идут, а по данным с проблемами отчёт не пишется
+
+HEADER = ["instrument_exch", "cur_base", "cur_quote", "side", "amount", "price", "ts"]
+
+def write_fills(path, rows):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        csv.writer(f).writerows([HEADER] + rows)
+
+def test_check_rejects_rows_with_issues():
+    checker = FillChecker()
+    assert checker.check(2, "USD/BRL", "USD", "BRL", "1", "10", "5.1", "1/16/23 0:00") is not None
+    assert checker.check(3, "USD/BRL", "USD", "BRL", "2", "10", "5.1", "1/16/23 0:01") is None
+    assert checker.check(4, "USD/BRL", "USD", "BRL", "-1", "-500", "5.1", "1/16/23 0:02") is None
+    assert [issue["line"] for issue in checker.issues] == [3, 4]
+
+def test_no_report_on_issues(tmp_path):
+    input_path, output_path, issues_path = tmp_path / "fills.csv", tmp_path / "pl.csv", tmp_path / "issues.csv"
+    write_fills(input_path, [["USD/BRL", "USD", "BRL", "1", "10", "5.1", "1/16/23 0:00"],
+                             ["USD/BRL", "USD", "BRL", "-1", "-500", "5.2", "1/16/23 0:01"]])
+    checker = FillChecker()
+    assert find_PnL.run(input_path, output_path, checker=checker, issues_path=issues_path) is None
+    assert not output_path.exists()
+    assert issues_path.exists() and checker.issues
+
+def test_report_on_clean_data(tmp_path):
+    input_path, output_path, issues_path = tmp_path / "fills.csv", tmp_path / "pl.csv", tmp_path / "issues.csv"
+    write_fills(input_path, [["USD/BRL", "USD", "BRL", "1", "10", "5.1", "1/16/23 0:00"],
+                             ["USD/BRL", "USD", "BRL", "-1", "4", "5.2", "1/16/23 0:01"]])
+    checker = FillChecker()
+    results = find_PnL.run(input_path, output_path, checker=checker, issues_path=issues_path)
+    assert checker.issues == []
+    assert results == find_PnL.compute_results(find_PnL.load_sorted_fills(input_path))
+    assert output_path.exists()
@@ -0,0 +1,121 @@
+import csv
+import random
+from pathlib import Path
+
+import pytest
+
+import find_PnL
+from lots import COMPACT_MIN, LotBook, Position
+
+TASK_DIR = Path(__file__).resolve().parent.parent
+
+# регрессия FIFO-мэтчинга lots.py против исходного find_PnL (списки лотов и pop(0)). ПнЛ реализации
+# складывается в том же порядке, поэтому realized и открытые лоты сравниваются точно; нереализованный ПнЛ
+# считается теперь по quantity/cost, а не по лотам, поэтому - с допуском
+
+# исходный мэтчинг одной позиции: (realized_quote, лонг лоты, шорт лоты)
+def baseline_match(fills):
+    lots, short_lots, realized = [], [], 0.0
+    for side, amount, price in fills:
+        remaining = amount
+        book, opposite = (short_lots, lots) if side == 1 else (lots, short_lots)
+        while remaining > 0 and book:
+            lot_amount, lot_price = book[0]
+            close_amount = min(remaining, lot_amount)
+            realized += close_amount * ((lot_price - price) if side == 1 else (price - lot_price))
+            remaining -= close_amount
+            if close_amount == lot_amount:
+                book.pop(0)
+            else:
+                book[0] = (lot_amount - close_amount, lot_price)
+        if remaining > 0:
+            opposite.append((remaining, price))
+    return realized, lots, short_lots
+
+def baseline_unrealized(lots, short_lots, last_price):
+    return sum(a * (last_price - p) for a, p in lots) + sum(a * (p - last_price) for a, p in short_lots)
+
+def matched(fills, quote_ccy="USD"):
+    position = Position(quote_ccy, fills[0][2])
+    for side, amount, price in fills:
+        position.fill(side, amount, price)
+    return position
+
+def assert_same_as_baseline(fills, quote_ccy="USD"):
+    position = matched(fills, quote_ccy)
+    realized, lots, short_lots = baseline_match(fills)
+    assert position.realized_quote == realized
+    assert list(position.lots) == lots
+    assert list(position.short_lots) == short_lots
+    assert position.lots.quantity == pytest.approx(sum(a for a, _ in lots))
+    assert position.short_lots.quantity == pytest.approx(sum(a for a, _ in short_lots))
+    last_price = fills[-1][2]
+    assert position.unrealized_quote() == pytest.approx(baseline_unrealized(lots, short_lots, last_price), abs=1e-6)
+    return position
+
+def test_partial_closes():
+    fills = [(1, 10.0, 100.0), (-1, 3.0, 110.0), (-1, 4.0, 120.0)]
+    position = assert_same_as_baseline(fills)
+    assert position.realized_quote == 3 * 10 + 4 * 20
+    assert list(position.lots) == [(3.0, 100.0)]
+
+def test_partial_close_across_several_lots():
+    fills = [(1, 2.0, 100.0), (1, 3.0, 101.0), (1, 4.0, 102.0), (-1, 6.0, 105.0)]
+    position = assert_same_as_baseline(fills)
+    assert list(position.lots) == [(3.0, 102.0)]
+
+def test_flip_through_zero():
+    fills = [(1, 5.0, 100.0), (-1, 8.0, 90.0), (1, 10.0, 80.0)]
+    position = assert_same_as_baseline(fills)
+    assert position.realized_quote == -50.0 + 30.0
+    assert list(position.short_lots) == []
+    assert list(position.lots) == [(7.0, 80.0)]
+    assert position.net_quantity() == 7.0
+
+def test_empty_book_resets_totals():
+    book = LotBook()
+    book.add(0.1, 1.1)
+    book.add(0.2, 1.3)
+    remaining, realized = book.close(0.1, 1.2, 0.0, 1)
+    remaining, realized = book.close(0.2, 1.2, realized, 1)
+    assert remaining == 0
+    assert realized == pytest.approx(0.1 * 0.1 - 0.2 * 0.1)
+    assert not book
+    assert (book.amounts, book.prices, book.head) == ([], [], 0)
+    assert book.quantity == 0.0 and book.cost == 0.0 # без накопленной погрешности 0.1 + 0.2
+    book.add(1.0, 2.0)
+    assert list(book) == [(1.0, 2.0)]
+
+def test_compaction_after_many_closes():
+    lots = COMPACT_MIN * 3
+    fills = [(1, 1.0, 100.0 + i) for i in range(lots)]
+    fills += [(-1, 1.0, 200.0)] * (lots - 10) # закрываем по одному лоту, голова уходит за COMPACT_MIN
+    position = assert_same_as_baseline(fills)
+    book = position.lots
+    assert len(book) == 10
+    assert book.head < COMPACT_MIN # закрытые лоты выкинуты из списков
+    assert len(book.amounts) - book.head == 10
+    assert list(book) == [(1.0, 100.0 + i) for i in range(lots - 10, lots)]
+
+def test_random_fills_match_baseline():
+    rng = random.Random(7)
+    for _ in range(50):
+        fills = [(rng.choice((1, -1)), float(rng.randint(1, 20)), round(rng.uniform(50, 150), 2)) for _ in range(rng.randint(1, 400))]
+        assert_same_as_baseline(fills)
+
+def test_pl_usd_matches_baseline_formula():
+    fills = [(1, 100.0, 5.1), (-1, 40.0, 5.3), (-1, 100.0, 5.0)]
+    position = matched(fills, quote_ccy="BRL")
+    realized, lots, short_lots = baseline_match(fills)
+    last_price = fills[-1][2]
+    unrealized = baseline_unrealized(lots, short_lots, last_price)
+    expected = (realized / last_price, unrealized / last_price, (realized + unrealized) / last_price)
+    assert position.pl_usd() == pytest.approx(expected)
+
+# весь отчёт по файлу задачи совпадает с pl_by_instrument.csv, сохранённым исходной версией
+def test_report_matches_baseline_output():
+    fills = find_PnL.load_sorted_fills(TASK_DIR / find_PnL.INPUT_CSV)
+    results = find_PnL.compute_results(fills)
+    with open(TASK_DIR / find_PnL.OUTPUT_CSV, newline="", encoding="utf-8") as f:
+        expected = [{k: (v if k == "instrument" else float(v)) for k, v in row.items()} for row in csv.DictReader(f)]
+    assert results == expected
@@ -0,0 +1,55 @@
+import csv
+
+import pytest
+
+import textio
+from records import RecordReader
+from textio import MmapLines, open_text
+
+# MmapLines должен вести себя как обычный текстовый файл: одноразовый итератор, декодирование в заданной кодировке,
+# закрытие без BufferError посреди чтения
+
+ROWS = [["a", "b"], ["1", "x"], ["2", "y,z"], ["3", "w"]]
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "data.csv"
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        csv.writer(f).writerows(ROWS)
+    return path
+
+def test_second_iter_continues(csv_path):
+    with MmapLines(csv_path, encoding="utf-8-sig") as f:
+        header = next(csv.reader(f))
+        reader = RecordReader(f, ("a", "b"), fieldnames=header)
+        assert header == ["a", "b"]
+        assert list(reader) == [tuple(r) for r in ROWS[1:]]
+        assert list(f) == []
+
+def test_matches_plain_open(csv_path, monkeypatch):
+    monkeypatch.setattr(textio, "MMAP_BLOCK", 5) # несколько блоков и строки длиннее блока
+    with MmapLines(csv_path, encoding="utf-8-sig") as f:
+        mapped = list(f)
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        assert mapped == list(f)
+
+def test_close_mid_iteration_and_on_error(csv_path):
+    f = MmapLines(csv_path)
+    next(f)
+    f.close()
+    with pytest.raises(ZeroDivisionError):
+        with MmapLines(csv_path) as f:
+            next(f)
+            1 / 0
+
+def test_uses_encoding(tmp_path):
+    path = tmp_path / "cp1251.csv"
+    path.write_bytes("имя\nзначение\n".encode("cp1251"))
+    with MmapLines(path, encoding="cp1251") as f:
+        assert list(f) == ["имя\n", "значение\n"]
+
+def test_open_text_uses_mmap_for_large_files(csv_path, monkeypatch):
+    monkeypatch.setattr(textio, "MMAP_MIN_SIZE", 1)
+    with open_text(csv_path, encoding="utf-8-sig") as f:
+        assert isinstance(f, MmapLines)
+        assert [tuple(r) for r in csv.reader(f)] == [tuple(r) for r in ROWS]
@@ -0,0 +1,114 @@
+import bz2
+import gzip
+import lzma
+import mmap
+import os
+
+COMPRESSORS = {"gz": gzip, "bz2": bz2, "xz": lzma}
+MMAP_MIN_SIZE = 1 << 26 # несжатые файлы от 64 МБ читаются через mmap
+MMAP_BLOCK = 1 << 22 # сколько байт декодируется за раз при чтении через mmap
+
+# общий модуль: task 1/textio.py и task 2/textio.py должны совпадать побайтно (задачи - отдельные папки скриптов без общего пакета),
+# правки вносить в обе копии; tests/test_shared_modules.py в task 1 это проверяет
+# открытие входных и выходных CSV для всех скриптов задачи.
+# вход: если файла нет, но рядом лежит сжатый вариант (<имя>.gz / .bz2 / .xz), он читается потоком без распаковки
+# на диск; большие несжатые файлы читаются через MmapLines. выход: с compress пишется <имя>.<compress>, а
+# другие варианты того же файла удаляются, чтобы следующий шаг не прочитал устаревшую копию.
+# режимы с байтовыми смещениями (параллельные --workers, --incremental) работают только с несжатыми файлами
+
+def compression_of(path):
+    ext = os.path.splitext(str(path))[1].lstrip(".")
+    return ext if ext in COMPRESSORS else None
+
+# путь, который реально будет прочитан для path (сам path, если ни одного варианта нет - тогда open даст FileNotFoundError)
+def resolve_input(path):
+    path = str(path)
+    if os.path.exists(path):
+        return path
+    for ext in COMPRESSORS:
+        if os.path.exists(f"{path}.{ext}"):
+            return f"{path}.{ext}"
+    return path
+
+def is_compressed(path):
+    return compression_of(resolve_input(path)) is not None
+
+# строки большого несжатого файла через mmap: блоки по MMAP_BLOCK байт (до последнего перевода строки) декодируются
+# прямо из отображения через memoryview, без промежуточных буферов чтения. как и обычный файл - одноразовый итератор:
+# следующий iter() продолжает с того же места (можно прочитать заголовок и потом отдать поток RecordReader).
+# кодировка должна быть совместима с ASCII (utf-8, cp1251, latin-1) - строки режутся по байту b"\n"
+class MmapLines:
+    def __init__(self, path, encoding="utf-8"):
+        self.encoding = encoding
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._view = memoryview(self._map) if self._map is not None else None
+        self._lines = self._read_lines()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._lines)
+
+    def _read_lines(self):
+        m, view = self._map, self._view
+        if m is None:
+            return
+        encoding = self.encoding
+        pos, size = 0, len(m)
+        if encoding == "utf-8-sig": # BOM только в начале файла, блоки дальше - обычный utf-8
+            if m[:3] == b"\xef\xbb\xbf":
+                pos = 3
+            encoding = "utf-8"
+        while pos < size:
+            end = m.rfind(b"\n", pos, min(pos + MMAP_BLOCK, size)) + 1
+            if end <= pos: # строка длиннее блока или хвост без перевода строки
+                end = m.find(b"\n", pos) + 1 or size
+            lines = str(view[pos:end], encoding).split("\n")
+            pos = end
+            last = lines.pop()
+            for line in lines:
+                yield line + "\n"
+            if last:
+                yield last
+
+    def close(self):
+        self._lines.close()
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# текстовый поток для чтения CSV (newline="" как у обычного open в скриптах)
+def open_text(path, encoding="utf-8"):
+    path = resolve_input(path)
+    compression = compression_of(path)
+    if compression:
+        return COMPRESSORS[compression].open(path, "rt", encoding=encoding, newline="")
+    if os.path.getsize(path) >= MMAP_MIN_SIZE:
+        return MmapLines(path, encoding)
+    return open(path, "r", encoding=encoding, newline="")
+
+def output_path(path, compress=None):
+    return f"{path}.{compress}" if compress else str(path)
+
+# файл для записи CSV; compress - "gz" / "bz2" / "xz" или None
+def open_output(path, compress=None, encoding="utf-8"):
+    target = output_path(path, compress)
+    for other in [str(path)] + [f"{path}.{ext}" for ext in COMPRESSORS]:
+        if other != target and os.path.exists(other):
+            os.remove(other)
+    if compress:
+        return COMPRESSORS[compress].open(target, "wt", encoding=encoding, newline="")
+    return open(target, "w", encoding=encoding, newline="")
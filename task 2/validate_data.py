@@ -1,6 +1,12 @@
 import csv
+import sys
 from datetime import datetime
 from pathlib import Path
+
+import metrics
+from fill_cache import load_or_build
+from records import RecordReader
+from textio import open_text
  
 INPUT_CSV = "task 2.csv"
 OUTPUT_ISSUES_CSV = "data_consistency_issues.csv"
@@ -14,6 +20,7 @@ REQUIRED_COLUMNS = [
     "price",
     "ts",
 ]
+ISSUE_COLUMNS = ["line", "instrument", "issue", "value"]
  
  
 # Same timestamp parsing expectations as find_PnL.py
@@ -25,73 +32,142 @@ def parse_ts(ts):
     return datetime(year, d[0], d[1], t[0], t[1])
  
  
-def main():
-    input_path = Path(__file__).parent / INPUT_CSV
-    issues_path = Path(__file__).parent / OUTPUT_ISSUES_CSV
- 
-    issues = []
-    instrument_info = {}
- 
-    with open(input_path, newline="", encoding="utf-8-sig") as f:
-        reader = csv.DictReader(f)
- 
-        if reader.fieldnames is None:
-            raise SystemExit("CSV has no header row.")
- 
-        missing = [c for c in REQUIRED_COLUMNS if c not in reader.fieldnames]
-        if missing:
-            raise SystemExit(f"Missing required columns: {missing}")
- 
-        for line_no, r in enumerate(reader, start=2):
-            inst = (r.get("instrument_exch")).strip()
-            base = (r.get("cur_base")).strip()
-            quote = (r.get("cur_quote")).strip()
- 
-            if not inst:
-                issues.append({"line": line_no, "instrument": "", "issue": "empty instrument_exch", "value": ""})
-                continue
-            if not base or not quote:
-                issues.append({"line": line_no, "instrument": inst, "issue": "empty cur_base/cur_quote", "value": f"{base}/{quote}"})
- 
-            if inst not in instrument_info:
-                instrument_info[inst] = {"base": base, "quote": quote, "first_line": line_no}
-            else:
-                if base and instrument_info[inst]["base"] and base != instrument_info[inst]["base"]:
-                    issues.append({"line": line_no, "instrument": inst, "issue": "cur_base changed within instrument", "value": f"{instrument_info[inst]['base']} -> {base}"})
-                if quote and instrument_info[inst]["quote"] and quote != instrument_info[inst]["quote"]:
-                    issues.append({"line": line_no, "instrument": inst, "issue": "cur_quote changed within instrument", "value": f"{instrument_info[inst]['quote']} -> {quote}"})
- 
-            expected_inst = f"{base}/{quote}" if base and quote else ""
-            if expected_inst and inst != expected_inst:
-                issues.append({"line": line_no, "instrument": inst, "issue": "instrument_exch != cur_base/cur_quote", "value": expected_inst})
- 
-            try:
-                parse_ts(r["ts"])
-            except Exception as e:
-                issues.append({"line": line_no, "instrument": inst, "issue": "bad ts (parse_ts failed)", "value": f"{r.get('ts')!r} ({e})"})
- 
-            try:
-                side_raw = float(r["side"])
-                side = int(side_raw)
-                if side_raw not in (1.0, -1.0) or side not in (1, -1):
-                    issues.append({"line": line_no, "instrument": inst, "issue": "side not in {1, -1}", "value": r.get("side")})
-            except Exception as e:
-                issues.append({"line": line_no, "instrument": inst, "issue": "bad side (float/int conversion failed)", "value": f"{r.get('side')!r} ({e})"})
- 
-            try:
-                amount = float(r["amount"])
-                if amount <= 0:
-                    issues.append({"line": line_no, "instrument": inst, "issue": "amount must be > 0", "value": r.get("amount")})
-            except Exception as e:
-                issues.append({"line": line_no, "instrument": inst, "issue": "bad amount (float conversion failed)", "value": f"{r.get('amount')!r} ({e})"})
- 
-            try:
-                price = float(r["price"])
-                if price <= 0:
-                    issues.append({"line": line_no, "instrument": inst, "issue": "price must be > 0", "value": r.get("price")})
-            except Exception as e:
-                issues.append({"line": line_no, "instrument": inst, "issue": "bad price (float conversion failed)", "value": f"{r.get('price')!r} ({e})"})
- 
+# проверки строк CSV по одной, общие для check_csv и find_PnL.py --validate (проверка в том же проходе, что и мэтчинг).
+# проверки, которые зависят только от (instrument_exch, cur_base, cur_quote) - пустые валюты, смена base/quote внутри
+# инструмента, формат instrument_exch - считаются один раз на тройку и дальше берутся из словаря
+class FillChecker:
+    def __init__(self):
+        self.issues = []
+        self.instrument_info = {}
+        self.rows = 0
+        self._static = {} # (inst, base, quote) -> кортеж (issue, value) в порядке проверок
+ 
+    def _static_issues(self, line_no, inst, base, quote):
+        found = []
+        if not base or not quote:
+            found.append(("empty cur_base/cur_quote", f"{base}/{quote}"))
+        info = self.instrument_info.get(inst)
+        if info is None:
+            self.instrument_info[inst] = {"base": base, "quote": quote, "first_line": line_no}
+        else:
+            if base and info["base"] and base != info["base"]:
+                found.append(("cur_base changed within instrument", f"{info['base']} -> {base}"))
+            if quote and info["quote"] and quote != info["quote"]:
+                found.append(("cur_quote changed within instrument", f"{info['quote']} -> {quote}"))
+        expected_inst = f"{base}/{quote}" if base and quote else ""
+        if expected_inst and inst != expected_inst:
+            found.append(("instrument_exch != cur_base/cur_quote", expected_inst))
+        return tuple(found)
+ 
+    # проверки строки, которые зависят только от инструмента и валют. False - instrument_exch пустой (дальше не проверяем)
+    def check_instrument(self, line_no, inst, base, quote):
+        if not inst:
+            self.issues.append({"line": line_no, "instrument": "", "issue": "empty instrument_exch", "value": ""})
+            return False
+        key = (inst, base, quote)
+        static = self._static.get(key)
+        if static is None:
+            static = self._static[key] = self._static_issues(line_no, inst, base, quote)
+        for issue, value in static:
+            self.issues.append({"line": line_no, "instrument": inst, "issue": issue, "value": value})
+        return True
+ 
+    # проверяет строку line_no (поля в порядке REQUIRED_COLUMNS, уже после strip). возвращает разобранную сделку
+    # (ts, instrument, quote, side, amount, price) как у find_PnL.FILL_CONVERTERS или None, если у строки есть проблемы
+    def check(self, line_no, inst, base, quote, side_raw, amount_raw, price_raw, ts_raw):
+        self.rows += 1
+        issues = self.issues
+        found = len(issues)
+        if not self.check_instrument(line_no, inst, base, quote):
+            return None
+ 
+        ts = side = amount = price = None
+        try:
+            ts = parse_ts(ts_raw)
+        except Exception as e:
+            issues.append({"line": line_no, "instrument": inst, "issue": "bad ts (parse_ts failed)", "value": f"{ts_raw!r} ({e})"})
+ 
+        try:
+            side_f = float(side_raw)
+            side = int(side_f)
+            if side_f not in (1.0, -1.0) or side not in (1, -1):
+                issues.append({"line": line_no, "instrument": inst, "issue": "side not in {1, -1}", "value": side_raw})
+        except Exception as e:
+            issues.append({"line": line_no, "instrument": inst, "issue": "bad side (float/int conversion failed)", "value": f"{side_raw!r} ({e})"})
+ 
+        try:
+            amount = float(amount_raw)
+            if amount <= 0:
+                issues.append({"line": line_no, "instrument": inst, "issue": "amount must be > 0", "value": amount_raw})
+        except Exception as e:
+            issues.append({"line": line_no, "instrument": inst, "issue": "bad amount (float conversion failed)", "value": f"{amount_raw!r} ({e})"})
+ 
+        try:
+            price = float(price_raw)
+            if price <= 0:
+                issues.append({"line": line_no, "instrument": inst, "issue": "price must be > 0", "value": price_raw})
+        except Exception as e:
+            issues.append({"line": line_no, "instrument": inst, "issue": "bad price (float conversion failed)", "value": f"{price_raw!r} ({e})"})
+ 
+        if len(issues) > found:
+            return None
+        return ts, inst, quote, side, amount, price
+ 
+ 
+# читатель сырых полей REQUIRED_COLUMNS по открытому CSV (с проверкой заголовка)
+def required_records(f):
+    reader = RecordReader(f, REQUIRED_COLUMNS)
+ 
+    if reader.fieldnames is None:
+        raise SystemExit("CSV has no header row.")
+ 
+    if reader.missing:
+        raise SystemExit(f"Missing required columns: {reader.missing}")
+    return reader
+ 
+ 
+# проверки по CSV: возвращает (issues, instrument_info)
+def check_csv(input_path):
+    checker = FillChecker()
+    with open_text(input_path, encoding="utf-8-sig") as f:
+        for line_no, row in enumerate(required_records(f), start=2):
+            checker.check(line_no, *row)
+ 
+    metrics.report(rows_read=checker.rows)
+    return checker.issues, checker.instrument_info
+ 
+ 
+# те же проверки по колоночному кешу (fill_cache.py) через FillChecker. построчных ошибок тут не бывает - кеш строится
+# только из файла, где все строки разбираются и проходят построчные проверки, так что остаются проверки по
+# (инструмент, base, quote), и issues совпадают с check_csv
+def check_cached(cache):
+    checker = FillChecker()
+    names, currencies = cache.instruments, cache.currencies
+    inst_col, base_col, quote_col = cache.instrument, cache.base, cache.quote
+    for i in range(cache.rows):
+        checker.check_instrument(i + 2, names[inst_col[i]], currencies[base_col[i]], currencies[quote_col[i]])
+    checker.rows = cache.rows
+ 
+    metrics.report(rows_read=cache.rows)
+    return checker.issues, checker.instrument_info
+ 
+ 
+# все проверки файла input_path, список проблем пишется в issues_path. возвращает (issues, instrument_info).
+# use_cache - читать колоночный кеш (строится при первом запуске), если файл без ошибок разбора
+def validate(input_path, issues_path, use_cache=False):
+    cache = load_or_build(input_path, parse_ts) if use_cache else None
+    if cache is not None:
+        with cache:
+            issues, instrument_info = check_cached(cache)
+    else:
+        issues, instrument_info = check_csv(input_path)
+ 
+    finish_issues(issues, instrument_info, issues_path)
+    return issues, instrument_info
+ 
+ 
+# проверки по инструментам целиком (после всех строк) и запись issues_path
+def finish_issues(issues, instrument_info, issues_path):
     for inst, info in instrument_info.items():
         base = info["base"]
         quote = info["quote"]
@@ -104,9 +180,17 @@ def main():
             })
  
     with open(issues_path, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=["line", "instrument", "issue", "value"])
+        w = csv.DictWriter(f, fieldnames=ISSUE_COLUMNS)
         w.writeheader()
         w.writerows(issues)
+    metrics.report(issues=len(issues), rows_written=len(issues))
+ 
+ 
+def main(use_cache=False):
+    input_path = Path(__file__).parent / INPUT_CSV
+    issues_path = Path(__file__).parent / OUTPUT_ISSUES_CSV
+ 
+    issues, instrument_info = validate(input_path, issues_path, use_cache)
  
     print(f"Checked: {input_path}")
     print(f"Instruments: {len(instrument_info)}")
@@ -122,4 +206,4 @@ def main():
  
  
 if __name__ == "__main__":
-    main()
+    main(use_cache="--cache" in sys.argv[1:])